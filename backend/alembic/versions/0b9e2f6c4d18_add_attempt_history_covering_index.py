@@ -0,0 +1,46 @@
+"""add attempt history covering index
+
+Revision ID: 0b9e2f6c4d18
+Revises: f3a7d1b8c254
+Create Date: 2026-10-17 16:58:30.417725
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b9e2f6c4d18'
+down_revision: Union[str, Sequence[str], None] = 'f3a7d1b8c254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_exam_attempts_user_recent',
+        'exam_attempts',
+        ['user_id', sa.text('id DESC')],
+        unique=False,
+        postgresql_include=[
+            'mode',
+            'exam_name',
+            'question_count',
+            'time_limit_seconds',
+            'started_at',
+            'submitted_at',
+            'score_percent',
+            'passed',
+        ],
+    )
+    # the new index leads with user_id, so it serves the foreign key lookups too
+    op.drop_index('ix_exam_attempts_user_id', table_name='exam_attempts')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_exam_attempts_user_id', 'exam_attempts', ['user_id'], unique=False)
+    op.drop_index('ix_exam_attempts_user_recent', table_name='exam_attempts')
@@ -0,0 +1,29 @@
+"""add question import key index
+
+Revision ID: 1c5a8e3b7f29
+Revises: 0b9e2f6c4d18
+Create Date: 2026-10-17 17:35:02.661284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c5a8e3b7f29'
+down_revision: Union[str, Sequence[str], None] = '0b9e2f6c4d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # not unique: banks imported before the importer upserted may hold duplicates
+    op.create_index('ix_questions_exam_number', 'questions', ['exam_name', 'question_number'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_questions_exam_number', table_name='questions')
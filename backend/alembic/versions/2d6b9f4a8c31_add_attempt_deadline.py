@@ -0,0 +1,44 @@
+"""add attempt deadline
+
+Revision ID: 2d6b9f4a8c31
+Revises: 1c5a8e3b7f29
+Create Date: 2026-10-17 19:12:48.305117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d6b9f4a8c31'
+down_revision: Union[str, Sequence[str], None] = '1c5a8e3b7f29'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('exam_attempts', sa.Column('deadline_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute(
+        """
+        UPDATE exam_attempts
+        SET deadline_at = started_at + make_interval(secs => time_limit_seconds)
+        WHERE mode = 'timed' AND time_limit_seconds IS NOT NULL
+        """
+    )
+    # only open timed attempts: the sweeper's scan stays as small as the backlog
+    op.create_index(
+        'ix_exam_attempts_open_deadline',
+        'exam_attempts',
+        ['deadline_at'],
+        unique=False,
+        postgresql_where=sa.text('submitted_at IS NULL AND deadline_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_exam_attempts_open_deadline', table_name='exam_attempts')
+    op.drop_column('exam_attempts', 'deadline_at')
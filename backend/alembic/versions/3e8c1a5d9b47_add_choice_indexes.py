@@ -0,0 +1,37 @@
+"""add choice indexes
+
+Revision ID: 3e8c1a5d9b47
+Revises: 2d6b9f4a8c31
+Create Date: 2026-10-17 20:03:31.570842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8c1a5d9b47'
+down_revision: Union[str, Sequence[str], None] = '2d6b9f4a8c31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_choices_question', 'choices', ['question_id'], unique=False)
+    op.create_index(
+        'ix_choices_correct',
+        'choices',
+        ['question_id', sa.text('id DESC')],
+        unique=False,
+        postgresql_include=['label'],
+        postgresql_where=sa.text('is_correct'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_choices_correct', table_name='choices')
+    op.drop_index('ix_choices_question', table_name='choices')
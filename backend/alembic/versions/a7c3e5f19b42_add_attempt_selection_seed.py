@@ -0,0 +1,30 @@
+"""add attempt selection seed
+
+Revision ID: a7c3e5f19b42
+Revises: 4b1f2c9d7e30
+Create Date: 2026-10-17 10:41:05.532871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f19b42'
+down_revision: Union[str, Sequence[str], None] = '4b1f2c9d7e30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('exam_attempts', sa.Column('selection_seed', sa.BigInteger(), nullable=True))
+    op.add_column('exam_attempts', sa.Column('bank_version', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('exam_attempts', 'bank_version')
+    op.drop_column('exam_attempts', 'selection_seed')
@@ -0,0 +1,40 @@
+"""add attempt pool
+
+Revision ID: c2d8f0a4b611
+Revises: a7c3e5f19b42
+Create Date: 2026-10-17 12:03:27.904413
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2d8f0a4b611'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e5f19b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'attempt_pool',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('exam_name', sa.String(length=120), nullable=True),
+        sa.Column('question_count', sa.Integer(), nullable=False),
+        sa.Column('bank_version', sa.String(length=32), nullable=False),
+        sa.Column('question_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_attempt_pool_key', 'attempt_pool', ['exam_name', 'question_count', 'bank_version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_attempt_pool_key', table_name='attempt_pool')
+    op.drop_table('attempt_pool')
@@ -0,0 +1,70 @@
+"""add attempt score counters
+
+Revision ID: d5e1a9c3f720
+Revises: c2d8f0a4b611
+Create Date: 2026-10-17 14:41:09.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5e1a9c3f720'
+down_revision: Union[str, Sequence[str], None] = 'c2d8f0a4b611'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('exam_attempts', sa.Column('correct_count', sa.Integer(), nullable=True))
+    op.add_column('exam_attempts', sa.Column('answered_count', sa.Integer(), nullable=True))
+    op.create_table(
+        'exam_attempt_topic_scores',
+        sa.Column('attempt_id', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(length=150), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('answered', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['attempt_id'], ['exam_attempts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('attempt_id', 'topic'),
+    )
+
+    # Backfill attempts whose questions are stored as rows. Seeded attempts keep
+    # NULL counters and are scored from their answers at submit.
+    op.execute(
+        """
+        INSERT INTO exam_attempt_topic_scores (attempt_id, topic, total, answered, correct)
+        SELECT aq.attempt_id,
+               COALESCE(aq.topic, 'Unknown'),
+               count(*),
+               count(a.id),
+               count(*) FILTER (WHERE a.selected_label = c.label)
+        FROM exam_attempt_questions aq
+        LEFT JOIN exam_answers a ON a.attempt_id = aq.attempt_id AND a.question_id = aq.question_id
+        LEFT JOIN choices c ON c.question_id = aq.question_id AND c.is_correct
+        GROUP BY 1, 2
+        """
+    )
+    op.execute(
+        """
+        UPDATE exam_attempts e
+        SET correct_count = s.correct, answered_count = s.answered
+        FROM (
+            SELECT attempt_id, sum(correct) AS correct, sum(answered) AS answered
+            FROM exam_attempt_topic_scores
+            GROUP BY attempt_id
+        ) s
+        WHERE e.id = s.attempt_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('exam_attempt_topic_scores')
+    op.drop_column('exam_attempts', 'answered_count')
+    op.drop_column('exam_attempts', 'correct_count')
@@ -0,0 +1,36 @@
+"""add attempt reviews
+
+Revision ID: e8b4c6d2a913
+Revises: d5e1a9c3f720
+Create Date: 2026-10-17 15:26:44.570193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4c6d2a913'
+down_revision: Union[str, Sequence[str], None] = 'd5e1a9c3f720'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'exam_attempt_reviews',
+        sa.Column('attempt_id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('raw_size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['attempt_id'], ['exam_attempts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('attempt_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('exam_attempt_reviews')
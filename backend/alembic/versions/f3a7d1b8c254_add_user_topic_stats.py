@@ -0,0 +1,118 @@
+"""add user topic stats
+
+Revision ID: f3a7d1b8c254
+Revises: e8b4c6d2a913
+Create Date: 2026-10-17 16:12:51.093417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7d1b8c254'
+down_revision: Union[str, Sequence[str], None] = 'e8b4c6d2a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # attempt counters go from per-topic to per-(topic, subtopic)
+    op.add_column(
+        'exam_attempt_topic_scores',
+        sa.Column('subtopic', sa.String(length=200), server_default='', nullable=False),
+    )
+    op.drop_constraint('exam_attempt_topic_scores_pkey', 'exam_attempt_topic_scores', type_='primary')
+    op.create_primary_key(
+        'exam_attempt_topic_scores_pkey', 'exam_attempt_topic_scores', ['attempt_id', 'topic', 'subtopic']
+    )
+    # Seeded attempts store no rows to re-split from. save_answers now keys
+    # counters by real subtopic, so open ones would silently stop counting per
+    # topic: drop them to untracked (NULL counters, scored from answers).
+    # Submitted ones keep their final topic-level rows (subtopic '').
+    op.execute(
+        """
+        UPDATE exam_attempts
+        SET correct_count = NULL, answered_count = NULL
+        WHERE selection_seed IS NOT NULL AND submitted_at IS NULL AND correct_count IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM exam_attempt_topic_scores s
+        USING exam_attempts e
+        WHERE e.id = s.attempt_id AND e.selection_seed IS NOT NULL AND e.submitted_at IS NULL
+        """
+    )
+    # re-split attempts stored as rows
+    op.execute(
+        """
+        DELETE FROM exam_attempt_topic_scores s
+        WHERE EXISTS (SELECT 1 FROM exam_attempt_questions aq WHERE aq.attempt_id = s.attempt_id)
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO exam_attempt_topic_scores (attempt_id, topic, subtopic, total, answered, correct)
+        SELECT aq.attempt_id,
+               COALESCE(aq.topic, 'Unknown'),
+               COALESCE(aq.subtopic, ''),
+               count(*),
+               count(a.id),
+               count(*) FILTER (WHERE a.selected_label = c.label)
+        FROM exam_attempt_questions aq
+        JOIN exam_attempts e ON e.id = aq.attempt_id AND e.correct_count IS NOT NULL
+        LEFT JOIN exam_answers a ON a.attempt_id = aq.attempt_id AND a.question_id = aq.question_id
+        LEFT JOIN choices c ON c.question_id = aq.question_id AND c.is_correct
+        GROUP BY 1, 2, 3
+        """
+    )
+
+    op.create_table(
+        'user_topic_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('topic', sa.String(length=150), nullable=False),
+        sa.Column('subtopic', sa.String(length=200), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('answered', sa.Integer(), nullable=False),
+        sa.Column('correct', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('recent_percent', sa.Float(), nullable=False),
+        sa.Column('last_percent', sa.Integer(), nullable=False),
+        sa.Column('last_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'topic', 'subtopic'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_topic_stats')
+    # fold subtopic rows back into one row per topic
+    op.execute(
+        """
+        WITH agg AS (
+            SELECT attempt_id, topic, min(subtopic) AS keep,
+                   sum(total) AS total, sum(answered) AS answered, sum(correct) AS correct
+            FROM exam_attempt_topic_scores
+            GROUP BY attempt_id, topic
+        )
+        UPDATE exam_attempt_topic_scores s
+        SET total = agg.total, answered = agg.answered, correct = agg.correct
+        FROM agg
+        WHERE s.attempt_id = agg.attempt_id AND s.topic = agg.topic AND s.subtopic = agg.keep
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM exam_attempt_topic_scores s
+        USING exam_attempt_topic_scores d
+        WHERE s.attempt_id = d.attempt_id AND s.topic = d.topic AND s.subtopic > d.subtopic
+        """
+    )
+    op.drop_constraint('exam_attempt_topic_scores_pkey', 'exam_attempt_topic_scores', type_='primary')
+    op.drop_column('exam_attempt_topic_scores', 'subtopic')
+    op.create_primary_key('exam_attempt_topic_scores_pkey', 'exam_attempt_topic_scores', ['attempt_id', 'topic'])
@@ -1,25 +1,20 @@
 import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import Request, Depends, HTTPException
 from sqlalchemy.orm import Session
 
+from .cache import LRUCache
+from .hashing import hash_password, verify_password  # noqa: F401  (re-exported for the routers)
 from .db import get_db
 from .models import User
 
-pwd = CryptContext(schemes=["argon2"], deprecated="auto")
-
 ALGO = "HS256"
 COOKIE_NAME = "access_token"
 ACCESS_TOKEN_DAYS = 14
 
-def hash_password(p: str) -> str:
-    return pwd.hash(p)
-
-def verify_password(p: str, h: str) -> bool:
-    return pwd.verify(p, h)
-
 def _secret() -> str:
     return os.getenv("JWT_SECRET", "dev-secret-change-me")
 
@@ -27,25 +22,74 @@ def create_access_token(*, user_id: int) -> str:
     exp = datetime.now(timezone.utc) + timedelta(days=ACCESS_TOKEN_DAYS)
     return jwt.encode({"sub": str(user_id), "exp": exp}, _secret(), algorithm=ALGO)
 
-def decode_token(token: str) -> int | None:
+def _decode(token: str) -> tuple[int, float] | None:
     try:
         payload = jwt.decode(token, _secret(), algorithms=[ALGO])
-        return int(payload["sub"])
-    except (JWTError, KeyError, ValueError):
+        return int(payload["sub"]), float(payload["exp"])
+    except (JWTError, KeyError, ValueError, TypeError):
+        return None
+
+
+def decode_token(token: str) -> int | None:
+    decoded = _decode(token)
+    return decoded[0] if decoded else None
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    What request handlers need to know about the caller; cached per token.
+    """
+    id: int
+    email: str
+    created_at: datetime
+
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# token -> Principal; skips the JWT decode and the users lookup on repeat requests
+_principals = LRUCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+def resolve_principal(token: str, db: Session) -> Principal | None:
+    principal = _principals.get(token)
+    if principal is not None:
+        return principal
+
+    decoded = _decode(token)
+    if not decoded:
+        return None
+    user_id, exp = decoded
+    user = db.get(User, user_id)
+    if not user:
         return None
 
+    principal = Principal(id=user.id, email=user.email, created_at=user.created_at)
+    # never outlive the token itself
+    _principals.set(token, principal, ttl=min(AUTH_CACHE_TTL_SECONDS, exp - time.time()))
+    return principal
 
-def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -> User | None:
+
+def invalidate_token(token: str) -> None:
+    """
+    Forget a token's cached principal (logout).
+    """
+    _principals.pop(token)
+
+
+def auth_cache_stats() -> dict:
+    return {**_principals.stats(), "ttl_seconds": AUTH_CACHE_TTL_SECONDS}
+
+
+def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -> Principal | None:
     token = request.cookies.get(COOKIE_NAME)
     if not token:
         return None
-    user_id = decode_token(token)
-    if not user_id:
-        return None
-    return db.get(User, user_id)
+    return resolve_principal(token, db)
 
 
-def require_user(user: User | None = Depends(get_current_user_optional)) -> User:
+def require_user(user: Principal | None = Depends(get_current_user_optional)) -> Principal:
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
@@ -0,0 +1,199 @@
+"""
+Password hashing off the request threads.
+
+argon2 is CPU-bound; run inline it holds FastAPI's threadpool (and the GIL)
+for every signup/login. Here it goes to a small process pool with a cap on
+queued work, so a login burst gets 503s instead of stalling exam traffic.
+The helpers are coroutines: a waiting hash holds no thread at all.
+
+Benchmark the configured parameters with:  python -m app.hashing --bench
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# argon2 cost parameters (memory in KiB)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+# 0 workers = hash inline (dev / single-user)
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+# hashes allowed to wait for a worker before new ones are rejected
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", "32"))
+HASH_POOL_TIMEOUT_SECONDS = float(os.getenv("HASH_POOL_TIMEOUT_SECONDS", "10"))
+
+
+class HashingBusy(Exception):
+    """
+    The hashing pool is saturated; the caller should retry later.
+    """
+
+
+def _make_context(time_cost: int, memory_cost: int, parallelism: int) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+# In the API process this is used for inline hashing; each pool worker
+# builds its own in _init_worker.
+_ctx = _make_context(ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM)
+
+
+def _init_worker(time_cost: int, memory_cost: int, parallelism: int) -> None:
+    global _ctx
+    _ctx = _make_context(time_cost, memory_cost, parallelism)
+
+
+def _hash(p: str) -> str:
+    return _ctx.hash(p)
+
+
+def _verify(p: str, h: str) -> bool:
+    return _ctx.verify(p, h)
+
+
+_lock = threading.Lock()
+_executor: ProcessPoolExecutor | None = None
+# running + waiting jobs; acquired without blocking so overload fails fast
+_slots = threading.BoundedSemaphore(max(1, HASH_POOL_WORKERS) + HASH_POOL_MAX_PENDING)
+_stats = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "in_flight": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=HASH_POOL_WORKERS,
+                    # spawn: the API process has threads, forking it is unsafe
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM),
+                )
+    return _executor
+
+
+def _finish(started: float) -> None:
+    # runs when the job itself ends, which may be after its caller gave up on it
+    elapsed = time.perf_counter() - started
+    with _lock:
+        _stats["in_flight"] -= 1
+        _stats["completed"] += 1
+        _stats["total_seconds"] += elapsed
+        _stats["max_seconds"] = max(_stats["max_seconds"], elapsed)
+    _slots.release()
+
+
+def _call_inline(started: float, fn, *args):
+    try:
+        return fn(*args)
+    finally:
+        _finish(started)
+
+
+async def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        with _lock:
+            _stats["rejected"] += 1
+        raise HashingBusy("Too many sign-in requests, please retry shortly")
+
+    started = time.perf_counter()
+    with _lock:
+        _stats["submitted"] += 1
+        _stats["in_flight"] += 1
+    if HASH_POOL_WORKERS <= 0:
+        return await asyncio.to_thread(_call_inline, started, fn, *args)
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _finish(started)
+        raise
+    # The slot is held until the job is done, not until this request stops
+    # waiting: a hash that timed out still occupies a worker, and releasing
+    # early would let the real backlog grow past workers + max_pending.
+    future.add_done_callback(lambda _future: _finish(started))
+    try:
+        # on timeout, wait_for cancels the future (a no-op once a worker has it)
+        return await asyncio.wait_for(asyncio.wrap_future(future), HASH_POOL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        with _lock:
+            _stats["timeouts"] += 1
+        raise HashingBusy("Password hashing timed out, please retry")
+
+
+async def hash_password(p: str) -> str:
+    return await _run(_hash, p)
+
+
+async def verify_password(p: str, h: str) -> bool:
+    return await _run(_verify, p, h)
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def hashing_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["avg_seconds"] = round(stats["total_seconds"] / stats["completed"], 4) if stats["completed"] else None
+    stats["total_seconds"] = round(stats["total_seconds"], 3)
+    stats["max_seconds"] = round(stats["max_seconds"], 4)
+    stats["workers"] = HASH_POOL_WORKERS
+    stats["max_pending"] = HASH_POOL_MAX_PENDING
+    stats["params"] = {
+        "time_cost": ARGON2_TIME_COST,
+        "memory_cost_kib": ARGON2_MEMORY_COST,
+        "parallelism": ARGON2_PARALLELISM,
+    }
+    return stats
+
+
+def _bench(rounds: int = 5) -> None:
+    candidates = [
+        (ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM),
+        (2, 19456, 1),  # OWASP minimum
+        (3, 65536, 4),  # RFC 9106 low-memory profile (argon2-cffi default)
+        (4, 131072, 4),
+    ]
+    print(f"{'time_cost':>9} {'memory_kib':>10} {'parallel':>8} {'hash_ms':>9} {'verify_ms':>9}")
+    for time_cost, memory_cost, parallelism in dict.fromkeys(candidates):
+        ctx = _make_context(time_cost, memory_cost, parallelism)
+        h = ctx.hash("benchmark-password")  # warm up
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            h = ctx.hash("benchmark-password")
+        t1 = time.perf_counter()
+        for _ in range(rounds):
+            ctx.verify("benchmark-password", h)
+        t2 = time.perf_counter()
+        print(
+            f"{time_cost:>9} {memory_cost:>10} {parallelism:>8} "
+            f"{(t1 - t0) / rounds * 1000:>9.1f} {(t2 - t1) / rounds * 1000:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--bench" not in sys.argv:
+        raise SystemExit("Usage: python -m app.hashing --bench")
+    _bench()
@@ -0,0 +1,70 @@
+"""
+HTTP validators for attempt resources.
+
+ETags are HMACs over what identifies a representation (attempt, position,
+user, the bank generation of question content, and for open attempts the
+saved answer), so a frozen resource's ETag can be recomputed and matched
+against If-None-Match without loading the attempt.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+_KEY = (os.getenv("ETAG_SECRET") or os.getenv("JWT_SECRET", "dev-secret-change-me")).encode("utf-8")
+
+# submitted attempts never change; let the browser reuse them for a while
+FROZEN_MAX_AGE_SECONDS = int(os.getenv("FROZEN_MAX_AGE_SECONDS", "600"))
+FROZEN_CACHE_CONTROL = f"private, max-age={FROZEN_MAX_AGE_SECONDS}"
+# open attempts: always revalidate (selected_label can change)
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    msg = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return '"' + hmac.new(_KEY, msg, hashlib.sha256).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag or tag == "*":
+            return True
+    return False
+
+
+def not_modified_since(request: Request, last_modified: datetime | None) -> bool:
+    # If-None-Match takes precedence when both are sent
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def cache_headers(etag: str, cache_control: str, last_modified: datetime | None = None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
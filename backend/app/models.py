@@ -3,17 +3,22 @@ from __future__ import annotations
 import enum
 from datetime import datetime, timezone
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     DateTime,
+    Float,
     func,
     Enum,
     ForeignKey,
     Integer,
+    LargeBinary,
     String,
     Text,
     UniqueConstraint,
     Index,
+    text,
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db import Base
 
@@ -24,6 +29,30 @@ class AttemptMode(str, enum.Enum):
 
 class ExamAttempt(Base):
     __tablename__ = "exam_attempts"
+    __table_args__ = (
+        # covers /me/attempts: keyset pages by (user_id, id DESC) as index-only scans
+        Index(
+            "ix_exam_attempts_user_recent",
+            "user_id",
+            text("id DESC"),
+            postgresql_include=[
+                "mode",
+                "exam_name",
+                "question_count",
+                "time_limit_seconds",
+                "started_at",
+                "submitted_at",
+                "score_percent",
+                "passed",
+            ],
+        ),
+        # open timed attempts by deadline, for the expiry sweeper
+        Index(
+            "ix_exam_attempts_open_deadline",
+            "deadline_at",
+            postgresql_where=text("submitted_at IS NULL AND deadline_at IS NOT NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -37,10 +66,22 @@ class ExamAttempt(Base):
 
     started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
     submitted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # started_at + time_limit_seconds for timed attempts; NULL = no deadline
+    deadline_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     score_percent: Mapped[int | None] = mapped_column(Integer, nullable=True)  # 0..100
     passed: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
 
+    # Virtual attempts: positions are replayed from this seed against the bank
+    # index with this version instead of being stored in exam_attempt_questions.
+    selection_seed: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    bank_version: Mapped[str | None] = mapped_column(String(32), nullable=True)
+
+    # Running score, kept in step with exam_answers by services.exam_flow.save_answers.
+    # NULL = not tracked (attempts from before the counters existed); scored from answers.
+    correct_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    answered_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
     attempt_questions: Mapped[list["ExamAttemptQuestion"]] = relationship(
         back_populates="attempt", cascade="all, delete-orphan"
     )
@@ -48,7 +89,7 @@ class ExamAttempt(Base):
         back_populates="attempt", cascade="all, delete-orphan"
     )
 
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     user: Mapped["User | None"] = relationship()
 
 
@@ -79,6 +120,34 @@ class ExamAttemptQuestion(Base):
     question: Mapped["Question"] = relationship()
 
 
+class ExamAttemptTopicScore(Base):
+    """
+    Per-(topic, subtopic) running counters for an attempt
+    (topic NULL is stored as "Unknown", subtopic NULL as "").
+    """
+    __tablename__ = "exam_attempt_topic_scores"
+
+    attempt_id: Mapped[int] = mapped_column(ForeignKey("exam_attempts.id", ondelete="CASCADE"), primary_key=True)
+    topic: Mapped[str] = mapped_column(String(150), primary_key=True)
+    subtopic: Mapped[str] = mapped_column(String(200), primary_key=True, default="")
+
+    total: Mapped[int] = mapped_column(Integer, nullable=False)
+    answered: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    correct: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ExamAttemptReview(Base):
+    """
+    Review of a submitted attempt, rendered once and stored as gzip'd JSON.
+    """
+    __tablename__ = "exam_attempt_reviews"
+
+    attempt_id: Mapped[int] = mapped_column(ForeignKey("exam_attempts.id", ondelete="CASCADE"), primary_key=True)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    raw_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
 class ExamAnswer(Base):
     __tablename__ = "exam_answers"
     __table_args__ = (
@@ -100,6 +169,10 @@ class ExamAnswer(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # import key: re-imports update the row with the same (exam_name, question_number)
+        Index("ix_questions_exam_number", "exam_name", "question_number"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
@@ -117,6 +190,17 @@ class Question(Base):
 
 class Choice(Base):
     __tablename__ = "choices"
+    __table_args__ = (
+        Index("ix_choices_question", "question_id"),
+        # correct label per question for set-based scoring, as an index-only lookup
+        Index(
+            "ix_choices_correct",
+            "question_id",
+            text("id DESC"),
+            postgresql_include=["label"],
+            postgresql_where=text("is_correct"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     question_id: Mapped[int] = mapped_column(ForeignKey("questions.id", ondelete="CASCADE"))
@@ -126,6 +210,37 @@ class Choice(Base):
 
     question: Mapped["Question"] = relationship(back_populates="choices")
 
+class QuestionBankState(Base):
+    """
+    Single-row table; generation is bumped whenever the question bank changes
+    so in-process indexes know to rebuild.
+    """
+    __tablename__ = "question_bank_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class AttemptPoolEntry(Base):
+    """
+    A ready-made balanced question set, claimed (and deleted) by /attempts/start.
+    """
+    __tablename__ = "attempt_pool"
+    __table_args__ = (
+        Index("ix_attempt_pool_key", "exam_name", "question_count", "bank_version"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    exam_name: Mapped[str | None] = mapped_column(String(120), nullable=True)
+    question_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    bank_version: Mapped[str] = mapped_column(String(32), nullable=False)
+
+    # position order, already shuffled
+    question_ids: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
 class User(Base):
     __tablename__ = "users"
     __table_args__ = (UniqueConstraint("email", name="uq_users_email"),)
@@ -139,3 +254,25 @@ class User(Base):
     nullable=False,
     default=lambda: datetime.now(timezone.utc),
 )
+
+
+class UserTopicStat(Base):
+    """
+    Per-user rollup of submitted attempts by (topic, subtopic), same keys as
+    ExamAttemptTopicScore. Updated at submit; rebuild with rebuild_user_stats.py.
+    """
+    __tablename__ = "user_topic_stats"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    topic: Mapped[str] = mapped_column(String(150), primary_key=True)
+    subtopic: Mapped[str] = mapped_column(String(200), primary_key=True)
+
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    answered: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    correct: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # trend: exponentially weighted percent over this user's attempts, newest weighted most
+    recent_percent: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    last_percent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
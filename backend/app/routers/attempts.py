@@ -0,0 +1,588 @@
+# app/routers/attempts.py
+"""
+Exam attempt routes.
+
+Each route body lives in a plain function that takes a sync Session. `router`
+serves them from sync `def` handlers over get_db; `async_router` serves the
+same functions from `async def` handlers over an AsyncSession via run_sync,
+so the event loop is never blocked while the query runs. main.py mounts one
+of the two depending on DB_ASYNC.
+"""
+from __future__ import annotations
+
+import gzip
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth import Principal, require_user
+from app.db import get_async_db, get_db
+from app.http_cache import (
+    FROZEN_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    cache_headers,
+    etag_matches,
+    make_etag,
+    not_modified,
+    not_modified_since,
+)
+from app.models import AttemptMode, ExamAnswer, ExamAttempt
+from app.routers.me import get_current_user
+from app.schemas import (
+    AnswerIn,
+    AttemptPageOut,
+    AttemptStartIn,
+    AttemptStartOut,
+    AttemptSummaryOut,
+    ChoiceOutSimple,
+    ProgressOut,
+    QuestionForAttemptOut,
+    ReviewItemOut,
+    SubmitOut,
+)
+from app.services.attempt_headers import (
+    AttemptHeader,
+    forget_attempt_header,
+    get_attempt_header,
+    header_of,
+    remember_attempt_header,
+)
+from app.services.user_stats import record_submission
+from app.services.question_content import content_generation, get_question_content, get_question_contents
+from app.services.question_snapshot import QuestionContent
+from app.services.review import FrozenReview, build_review_items, cached_review, frozen_review
+from app.services.exam_flow import (
+    attempt_slot,
+    attempt_slots,
+    create_attempt_with_balanced_questions,
+    finalize_attempt,
+    save_answers,
+    score_attempt,
+)
+
+router = APIRouter(tags=["attempts"])
+async_router = APIRouter(tags=["attempts"])
+
+MAX_QUESTION_WINDOW = 50
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _get_attempt_or_404(
+    db: Session,
+    attempt_id: int,
+    user: Principal,
+    for_update: bool = False,
+) -> ExamAttempt:
+    attempt = db.get(ExamAttempt, attempt_id, with_for_update=for_update)
+    if not attempt:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+
+    if attempt.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return attempt
+
+
+def _get_header_or_404(db: Session, attempt_id: int, user: Principal) -> AttemptHeader:
+    # cached: ownership and timer checks on question/answer calls skip the database
+    header = get_attempt_header(db, attempt_id)
+    if header is None:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+
+    if header.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return header
+
+
+def _ensure_not_expired(attempt: ExamAttempt | AttemptHeader):
+    if attempt.mode != AttemptMode.timed:
+        return
+    if attempt.submitted_at is not None:
+        return
+    if attempt.time_limit_seconds is None:
+        return
+    # compare timestamps safely (attempt.started_at stored as utc naive by default in your service)
+    started = attempt.started_at
+
+    # Make started timezone-aware in UTC if DB returned naive
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=timezone.utc)
+
+    now = _utcnow()
+    elapsed = (now - started).total_seconds()
+
+    if elapsed > attempt.time_limit_seconds:
+        raise HTTPException(status_code=403, detail="Time limit exceeded. Please submit the attempt.")
+
+
+def _accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "")
+
+
+def _question_for_attempt(
+    attempt: ExamAttempt | AttemptHeader, aq, q: QuestionContent, selected: str | None
+) -> QuestionForAttemptOut:
+    # Explanation visibility rule
+    allow_expl = (attempt.mode == AttemptMode.practice) or (attempt.submitted_at is not None)
+    explanation = q.explanation if allow_expl else None
+
+    return QuestionForAttemptOut(
+        attempt_id=attempt.id,
+        position=aq.position,
+        question_id=q.id,
+        text=q.text,
+        topic=aq.topic,
+        subtopic=aq.subtopic,
+        choices=[ChoiceOutSimple(label=c.label, text=c.text) for c in q.choices],
+        explanation=explanation,
+        selected_label=selected,
+    )
+
+
+# ----------------------------
+# Route bodies (sync Session)
+# ----------------------------
+
+def _start_attempt(db: Session, user: Principal, payload: AttemptStartIn) -> AttemptStartOut:
+    try:
+        mode_enum = AttemptMode(payload.mode)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+
+    try:
+        attempt = create_attempt_with_balanced_questions(
+            db,
+            mode=mode_enum,
+            exam_name=payload.exam_name,
+            question_count=payload.question_count,
+            user_id=user.id,  # always present
+            time_limit_seconds=payload.time_limit_seconds,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return AttemptStartOut(
+        attempt_id=attempt.id,
+        mode=attempt.mode.value,
+        exam_name=attempt.exam_name,
+        question_count=attempt.question_count,
+        time_limit_seconds=attempt.time_limit_seconds,
+        started_at=attempt.started_at,
+    )
+
+
+def _get_attempt_question(
+    db: Session, user: Principal, attempt_id: int, position: int, request: Request, response: Response
+) -> QuestionForAttemptOut | Response:
+    # a submitted attempt's answers are final, its question content is not (an
+    # import can edit it): revalidate against the bank generation, no attempt lookup
+    generation = content_generation(db)
+    final_etag = make_etag("question", attempt_id, position, user.id, "final", generation)
+    if etag_matches(request, final_etag):
+        return not_modified(cache_headers(final_etag, FROZEN_CACHE_CONTROL))
+
+    attempt = _get_header_or_404(db, attempt_id, user)
+    _ensure_not_expired(attempt)
+
+    aq = attempt_slot(db, attempt, position)
+    if not aq:
+        raise HTTPException(status_code=404, detail="Question position not found")
+
+    q = get_question_content(db, aq.question_id)
+    if not q:
+        raise HTTPException(status_code=404, detail="Question not found")
+
+    # Get saved answer if any
+    ans_stmt = (
+        select(ExamAnswer.selected_label)
+        .where(ExamAnswer.attempt_id == attempt_id)
+        .where(ExamAnswer.question_id == q.id)
+    )
+    selected = db.execute(ans_stmt).scalar_one_or_none()
+
+    if attempt.submitted_at is not None:
+        headers = cache_headers(final_etag, FROZEN_CACHE_CONTROL, attempt.submitted_at)
+        if not_modified_since(request, attempt.submitted_at):
+            return not_modified(headers)
+    else:
+        # open attempt: the saved answer is part of the representation
+        etag = make_etag(
+            "question", attempt_id, position, user.id, attempt.mode.value, q.id, selected or "", generation
+        )
+        headers = cache_headers(etag, REVALIDATE_CACHE_CONTROL)
+        if etag_matches(request, etag):
+            return not_modified(headers)
+
+    response.headers.update(headers)
+    return _question_for_attempt(attempt, aq, q, selected)
+
+
+def _get_attempt_question_window(
+    db: Session, user: Principal, attempt_id: int, from_: int, to: int
+) -> list[QuestionForAttemptOut]:
+    if to < from_:
+        raise HTTPException(status_code=400, detail="'to' must be >= 'from'")
+    if to - from_ + 1 > MAX_QUESTION_WINDOW:
+        raise HTTPException(status_code=400, detail=f"Window larger than {MAX_QUESTION_WINDOW} positions")
+
+    attempt = _get_header_or_404(db, attempt_id, user)
+    _ensure_not_expired(attempt)
+
+    aqs = attempt_slots(db, attempt, from_, to)
+    if not aqs:
+        raise HTTPException(status_code=404, detail="Question position not found")
+    qids = [aq.question_id for aq in aqs]
+
+    q_map = get_question_contents(db, qids)
+
+    ans_stmt = (
+        select(ExamAnswer.question_id, ExamAnswer.selected_label)
+        .where(ExamAnswer.attempt_id == attempt_id)
+        .where(ExamAnswer.question_id.in_(qids))
+    )
+    ans_map = {qid: sel for (qid, sel) in db.execute(ans_stmt).all()}
+
+    return [
+        _question_for_attempt(attempt, aq, q_map[aq.question_id], ans_map.get(aq.question_id))
+        for aq in aqs
+        if aq.question_id in q_map
+    ]
+
+
+def _answer_questions(db: Session, user: Principal, attempt_id: int, answers: list[AnswerIn]) -> int:
+    attempt = _get_header_or_404(db, attempt_id, user)
+    _ensure_not_expired(attempt)
+    if attempt.submitted_at is not None:
+        raise HTTPException(status_code=400, detail="Attempt already submitted")
+
+    # row lock: save_answers moves the attempt's running score. The header may
+    # predate a submit by another worker, so re-check under the lock.
+    submitted_at = db.execute(
+        select(ExamAttempt.submitted_at).where(ExamAttempt.id == attempt_id).with_for_update()
+    ).scalar_one()
+    if submitted_at is not None:
+        forget_attempt_header(attempt_id)
+        raise HTTPException(status_code=400, detail="Attempt already submitted")
+
+    try:
+        return save_answers(db, attempt, [(a.question_id, a.selected_label) for a in answers])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _check_answer_batch(payload: list[AnswerIn]) -> None:
+    if not payload:
+        raise HTTPException(status_code=400, detail="No answers given")
+    if len(payload) > 300:
+        raise HTTPException(status_code=400, detail="Too many answers in one request")
+
+
+def _submit_attempt(db: Session, user: Principal, attempt_id: int) -> SubmitOut:
+    # locked so no answer lands between reading the counters and closing the attempt
+    attempt = _get_attempt_or_404(db, attempt_id, user, for_update=True)
+    if attempt.submitted_at is not None:
+        raise HTTPException(status_code=400, detail="Attempt already submitted")
+
+    #Always set submitted_at BEFORE returning
+    submitted_at = datetime.now(timezone.utc)
+    # scored from the running counters and closed in one statement
+    score = finalize_attempt(db, attempt, submitted_at)
+    if not score.total:
+        raise HTTPException(status_code=400, detail="Attempt has no questions")
+    total, correct, breakdown = score.total, score.correct, score.breakdown
+    score_percent, passed = attempt.score_percent, attempt.passed
+
+    record_submission(db, attempt)
+    header = header_of(attempt)
+
+    db.commit()
+    remember_attempt_header(header)
+
+    #Use submitted_at variable so response is never None
+    return SubmitOut(
+        attempt_id=attempt_id,
+        score_percent=score_percent,
+        passed=passed,
+        total_questions=total,
+        correct=correct,
+        breakdown_by_topic=breakdown,
+        submitted_at=submitted_at,
+    )
+
+
+def _attempt_progress(db: Session, user: Principal, attempt_id: int) -> ProgressOut:
+    attempt = _get_attempt_or_404(db, attempt_id, user)
+
+    # same rule as review: no peeking at correctness during a timed attempt
+    if attempt.mode == AttemptMode.timed and attempt.submitted_at is None:
+        raise HTTPException(status_code=403, detail="Progress available after submission")
+
+    score = score_attempt(db, attempt)
+    answered = attempt.answered_count
+    if answered is None:
+        answered = db.execute(
+            select(func.count()).select_from(ExamAnswer).where(ExamAnswer.attempt_id == attempt_id)
+        ).scalar_one()
+    return ProgressOut(
+        attempt_id=attempt_id,
+        answered=answered,
+        correct=score.correct,
+        total_questions=score.total,
+        breakdown_by_topic=score.breakdown,
+    )
+
+
+def _review_etag(attempt_id: int, user: Principal, request: Request) -> str:
+    # gzip and identity bodies differ byte for byte, so they get different strong ETags
+    return make_etag("review", attempt_id, user.id, "gzip" if _accepts_gzip(request) else "identity")
+
+
+def _review_response(review: FrozenReview, request: Request, etag: str) -> Response:
+    headers = cache_headers(etag, FROZEN_CACHE_CONTROL, review.submitted_at)
+    headers["Vary"] = "Accept-Encoding"
+    if not_modified_since(request, review.submitted_at):
+        return not_modified(headers)
+    # stored bytes go out as-is; only clients without gzip pay for decompression
+    if _accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return Response(review.payload, media_type="application/json", headers=headers)
+    return Response(gzip.decompress(review.payload), media_type="application/json", headers=headers)
+
+
+def _review_attempt(db: Session, user: Principal, attempt_id: int, request: Request) -> list[ReviewItemOut] | Response:
+    # a submitted review is frozen when first rendered: revalidate without the database
+    etag = _review_etag(attempt_id, user, request)
+    if etag_matches(request, etag):
+        headers = cache_headers(etag, FROZEN_CACHE_CONTROL)
+        headers["Vary"] = "Accept-Encoding"
+        return not_modified(headers)
+
+    review = cached_review(attempt_id)
+    if review is not None:
+        if review.user_id != user.id:
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return _review_response(review, request, etag)
+
+    attempt = _get_attempt_or_404(db, attempt_id, user)
+
+    # rule: in timed/exam mode, only after submit; in practice, always ok
+    if attempt.mode == AttemptMode.timed and attempt.submitted_at is None:
+        raise HTTPException(status_code=403, detail="Review available after submission")
+
+    # open practice attempt: answers can still change, render live
+    if attempt.submitted_at is None:
+        return build_review_items(db, attempt)
+
+    return _review_response(frozen_review(db, attempt), request, etag)
+
+
+MAX_ATTEMPT_PAGE = 200
+
+
+def _my_attempts(
+    db: Session,
+    user: Principal,
+    cursor: int | None,
+    limit: int,
+    mode: AttemptMode | None,
+    exam_name: str | None,
+    submitted: bool | None,
+) -> AttemptPageOut:
+    # summary columns only, so ix_exam_attempts_user_recent answers it with an
+    # index-only scan that starts at the cursor: deep pages cost the same as the first
+    stmt = (
+        select(
+            ExamAttempt.id,
+            ExamAttempt.mode,
+            ExamAttempt.exam_name,
+            ExamAttempt.question_count,
+            ExamAttempt.time_limit_seconds,
+            ExamAttempt.started_at,
+            ExamAttempt.submitted_at,
+            ExamAttempt.score_percent,
+            ExamAttempt.passed,
+        )
+        .where(ExamAttempt.user_id == user.id)
+        .order_by(ExamAttempt.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(ExamAttempt.id < cursor)
+    if mode is not None:
+        stmt = stmt.where(ExamAttempt.mode == mode)
+    if exam_name is not None:
+        stmt = stmt.where(ExamAttempt.exam_name == exam_name)
+    if submitted is not None:
+        stmt = stmt.where(ExamAttempt.submitted_at.is_not(None) if submitted else ExamAttempt.submitted_at.is_(None))
+
+    rows = db.execute(stmt).all()
+    items = [
+        AttemptSummaryOut(
+            attempt_id=r.id,
+            mode=r.mode,
+            exam_name=r.exam_name,
+            question_count=r.question_count,
+            time_limit_seconds=r.time_limit_seconds,
+            started_at=r.started_at,
+            submitted_at=r.submitted_at,
+            score_percent=r.score_percent,
+            passed=r.passed,
+        )
+        for r in rows[:limit]
+    ]
+    next_cursor = items[-1].attempt_id if len(rows) > limit else None
+    return AttemptPageOut(items=items, next_cursor=next_cursor)
+
+
+# ----------------------------
+# Sync routes
+# ----------------------------
+
+@router.post("/attempts/start", response_model=AttemptStartOut)
+def start_attempt(
+    payload: AttemptStartIn,
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),   #require auth
+):
+    return _start_attempt(db, user, payload)
+
+
+@router.get("/attempts/{attempt_id}/questions/{position}", response_model=QuestionForAttemptOut)
+def get_attempt_question(attempt_id: int, position: int, request: Request, response: Response, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    return _get_attempt_question(db, user, attempt_id, position, request, response)
+
+
+@router.get("/attempts/{attempt_id}/questions", response_model=list[QuestionForAttemptOut])
+def get_attempt_question_window(
+    attempt_id: int,
+    from_: int = Query(alias="from", ge=1),
+    to: int = Query(ge=1),
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    """
+    Positions from..to (inclusive) in one round trip; the same checks and
+    lookups as the single-question route, batched across the window.
+    """
+    return _get_attempt_question_window(db, user, attempt_id, from_, to)
+
+
+@router.post("/attempts/{attempt_id}/answer")
+def answer_question(attempt_id: int, payload: AnswerIn, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    _answer_questions(db, user, attempt_id, [payload])
+    return {"ok": True}
+
+
+@router.post("/attempts/{attempt_id}/answers")
+def answer_questions(attempt_id: int, payload: list[AnswerIn], db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    _check_answer_batch(payload)
+    saved = _answer_questions(db, user, attempt_id, payload)
+    return {"ok": True, "saved": saved}
+
+
+@router.post("/attempts/{attempt_id}/submit", response_model=SubmitOut)
+def submit_attempt(attempt_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    return _submit_attempt(db, user, attempt_id)
+
+
+@router.get("/attempts/{attempt_id}/progress", response_model=ProgressOut)
+def attempt_progress(attempt_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    return _attempt_progress(db, user, attempt_id)
+
+
+@router.get("/attempts/{attempt_id}/review", response_model=list[ReviewItemOut])
+def review_attempt(attempt_id: int, request: Request, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    return _review_attempt(db, user, attempt_id, request)
+
+
+@router.get("/me/attempts", response_model=AttemptPageOut)
+def my_attempts(
+    cursor: int | None = Query(default=None, ge=1),
+    limit: int = Query(default=50, ge=1, le=MAX_ATTEMPT_PAGE),
+    mode: AttemptMode | None = None,
+    exam_name: str | None = None,
+    submitted: bool | None = None,
+    user: Principal = Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Newest first. Pass next_cursor back as ?cursor= to get the next page.
+    """
+    return _my_attempts(db, user, cursor, limit, mode, exam_name, submitted)
+
+
+# ----------------------------
+# Async routes (DB_ASYNC=1)
+# ----------------------------
+
+@async_router.post("/attempts/start", response_model=AttemptStartOut)
+async def start_attempt_async(
+    payload: AttemptStartIn,
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    return await db.run_sync(_start_attempt, user, payload)
+
+
+@async_router.get("/attempts/{attempt_id}/questions/{position}", response_model=QuestionForAttemptOut)
+async def get_attempt_question_async(attempt_id: int, position: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    return await db.run_sync(_get_attempt_question, user, attempt_id, position, request, response)
+
+
+@async_router.get("/attempts/{attempt_id}/questions", response_model=list[QuestionForAttemptOut])
+async def get_attempt_question_window_async(
+    attempt_id: int,
+    from_: int = Query(alias="from", ge=1),
+    to: int = Query(ge=1),
+    db: AsyncSession = Depends(get_async_db),
+    user: Principal = Depends(get_current_user),
+):
+    return await db.run_sync(_get_attempt_question_window, user, attempt_id, from_, to)
+
+
+@async_router.post("/attempts/{attempt_id}/answer")
+async def answer_question_async(attempt_id: int, payload: AnswerIn, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    await db.run_sync(_answer_questions, user, attempt_id, [payload])
+    return {"ok": True}
+
+
+@async_router.post("/attempts/{attempt_id}/answers")
+async def answer_questions_async(attempt_id: int, payload: list[AnswerIn], db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    _check_answer_batch(payload)
+    saved = await db.run_sync(_answer_questions, user, attempt_id, payload)
+    return {"ok": True, "saved": saved}
+
+
+@async_router.post("/attempts/{attempt_id}/submit", response_model=SubmitOut)
+async def submit_attempt_async(attempt_id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    return await db.run_sync(_submit_attempt, user, attempt_id)
+
+
+@async_router.get("/attempts/{attempt_id}/progress", response_model=ProgressOut)
+async def attempt_progress_async(attempt_id: int, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    return await db.run_sync(_attempt_progress, user, attempt_id)
+
+
+@async_router.get("/attempts/{attempt_id}/review", response_model=list[ReviewItemOut])
+async def review_attempt_async(attempt_id: int, request: Request, db: AsyncSession = Depends(get_async_db), user: Principal = Depends(get_current_user)):
+    return await db.run_sync(_review_attempt, user, attempt_id, request)
+
+
+@async_router.get("/me/attempts", response_model=AttemptPageOut)
+async def my_attempts_async(
+    cursor: int | None = Query(default=None, ge=1),
+    limit: int = Query(default=50, ge=1, le=MAX_ATTEMPT_PAGE),
+    mode: AttemptMode | None = None,
+    exam_name: str | None = None,
+    submitted: bool | None = None,
+    user: Principal = Depends(require_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_my_attempts, user, cursor, limit, mode, exam_name, submitted)
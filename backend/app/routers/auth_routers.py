@@ -1,26 +1,49 @@
-from fastapi import APIRouter, Response, Depends, HTTPException
+from fastapi import APIRouter, Request, Response, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 from ..models import User
 from ..schemas import SignupIn, LoginIn, UserOut
-from ..auth import COOKIE_NAME, create_access_token, hash_password, verify_password, require_user
+from ..auth import (
+    COOKIE_NAME,
+    Principal,
+    create_access_token,
+    hash_password,
+    verify_password,
+    require_user,
+    invalidate_token,
+)
 from ..db import get_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+# async handlers: hashing is awaited without holding a threadpool thread;
+# the short queries go to the threadpool on their own
+
+
+def _find_user(db: Session, email: str) -> User | None:
+    return db.scalar(select(User).where(User.email == email))
+
+
+def _add_user(db: Session, email: str, password_hash: str) -> User:
+    u = User(email=email, password_hash=password_hash)
+    db.add(u)
+    db.commit()
+    db.refresh(u)
+    return u
+
+
 @router.post("/signup", response_model=UserOut)
-def signup(payload: SignupIn, response: Response, db: Session = Depends(get_db)):
+async def signup(payload: SignupIn, response: Response, db: Session = Depends(get_db)):
     email = payload.email.lower().strip()
-    existing = db.scalar(select(User).where(User.email == email))
+    existing = await run_in_threadpool(_find_user, db, email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    u = User(email=email, password_hash=hash_password(payload.password))
-    db.add(u)
-    db.commit()
-    db.refresh(u)
+    password_hash = await hash_password(payload.password)
+    u = await run_in_threadpool(_add_user, db, email, password_hash)
 
     token = create_access_token(user_id=u.id)
     response.set_cookie(
@@ -35,10 +58,10 @@ def signup(payload: SignupIn, response: Response, db: Session = Depends(get_db))
     return UserOut(id=u.id, email=u.email)
 
 @router.post("/login", response_model=UserOut)
-def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
+async def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
     email = payload.email.lower().strip()
-    u = db.scalar(select(User).where(User.email == email))
-    if not u or not verify_password(payload.password, u.password_hash):
+    u = await run_in_threadpool(_find_user, db, email)
+    if not u or not await verify_password(payload.password, u.password_hash):
         raise HTTPException(status_code=400, detail="Invalid email or password")
 
     token = create_access_token(user_id=u.id)
@@ -54,10 +77,13 @@ def login(payload: LoginIn, response: Response, db: Session = Depends(get_db)):
     return UserOut(id=u.id, email=u.email)
 
 @router.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response):
+    token = request.cookies.get(COOKIE_NAME)
+    if token:
+        invalidate_token(token)
     response.delete_cookie(key=COOKIE_NAME, path="/")
     return {"ok": True}
 
 @router.get("/me", response_model=UserOut)
-def me(user: User = Depends(require_user)):
+def me(user: Principal = Depends(require_user)):
     return UserOut(id=user.id, email=user.email)
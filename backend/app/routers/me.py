@@ -5,31 +5,31 @@ from fastapi import APIRouter, Cookie, Depends, HTTPException, status
 from typing import Annotated
 from sqlalchemy.orm import Session
 
-from app.auth import COOKIE_NAME, decode_token
+from app.auth import COOKIE_NAME, Principal, decode_token, resolve_principal
 from app.db import get_db
-from app.models import User
+from app.schemas import TopicStatOut
+from app.services.user_stats import user_topic_stats
 
 router = APIRouter(tags=["me"])
 
 def get_current_user(
     access_token: Annotated[str | None, Cookie(alias=COOKIE_NAME)] = None,
     db: Session = Depends(get_db),
-) -> User:
+) -> Principal:
     if not access_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
         )
 
-    user_id = decode_token(access_token)
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-        )
-
-    user = db.get(User, user_id)  # SQLAlchemy 2.0 style
+    # cached per token, so most requests skip the JWT decode and the users table
+    user = resolve_principal(access_token, db)
     if not user:
+        if not decode_token(access_token):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token",
+            )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
@@ -38,9 +38,28 @@ def get_current_user(
     return user
 
 @router.get("/me")
-def me(user: User = Depends(get_current_user)):
+def me(user: Principal = Depends(get_current_user)):
     return {
         "id": user.id,
         "email": user.email,
         "created_at": user.created_at,
     }
+
+
+@router.get("/me/stats", response_model=list[TopicStatOut])
+def my_stats(user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    return [
+        TopicStatOut(
+            topic=s.topic,
+            subtopic=s.subtopic or None,
+            attempts=s.attempts,
+            answered=s.answered,
+            correct=s.correct,
+            total=s.total,
+            accuracy_percent=int(round(100 * s.correct / s.total)) if s.total else 0,
+            recent_percent=round(s.recent_percent, 1),
+            last_percent=s.last_percent,
+            last_attempt_at=s.last_attempt_at,
+        )
+        for s in user_topic_stats(db, user.id)
+    ]
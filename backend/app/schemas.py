@@ -27,6 +27,23 @@ class AttemptStartOut(BaseModel):
     started_at: datetime
 
 
+class AttemptSummaryOut(BaseModel):
+    attempt_id: int
+    mode: AttemptMode
+    exam_name: str | None
+    question_count: int
+    time_limit_seconds: int | None
+    started_at: datetime
+    submitted_at: datetime | None
+    score_percent: int | None
+    passed: bool | None
+
+
+class AttemptPageOut(BaseModel):
+    items: list[AttemptSummaryOut]
+    next_cursor: int | None  # pass back as ?cursor= for the next (older) page
+
+
 class ChoiceOutSimple(BaseModel):
     label: str
     text: str
@@ -61,6 +78,27 @@ class SubmitOut(BaseModel):
     submitted_at: datetime
 
 
+class ProgressOut(BaseModel):
+    attempt_id: int
+    answered: int
+    correct: int
+    total_questions: int
+    breakdown_by_topic: dict[str, dict[str, int]]  # {topic: {correct, total}}
+
+
+class TopicStatOut(BaseModel):
+    topic: str
+    subtopic: str | None
+    attempts: int
+    answered: int
+    correct: int
+    total: int
+    accuracy_percent: int
+    recent_percent: float  # weighted toward the latest attempts
+    last_percent: int
+    last_attempt_at: datetime | None
+
+
 class ReviewItemOut(BaseModel):
     position: int
     question_id: int
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Iterable
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.models import Choice
+from app.services.question_bank import BANK_REFRESH_SECONDS, get_bank_generation
+from app.services.question_snapshot import current_snapshot
+
+
+class AnswerKey:
+    """
+    Immutable map question id -> correct label for the whole bank.
+
+    One byte per question id: codes[qid] indexes into `labels` (0 = no correct
+    choice recorded), so a 10k-question bank costs ~10 KB and scoring or
+    review never queries `choices`.
+    """
+
+    __slots__ = ("generation", "codes", "labels", "entries", "load_seconds")
+
+    def __init__(self, generation: int, rows: list[tuple[int, str]], max_id: int, load_seconds: float = 0.0):
+        self.generation = generation
+        self.codes = bytearray(max_id + 1)
+        labels: dict[str, int] = {}
+        for qid, label in rows:
+            code = labels.setdefault(label, len(labels) + 1)
+            if code > 255:
+                raise ValueError("Too many distinct choice labels for the answer key")
+            self.codes[qid] = code
+        self.labels: tuple[str | None, ...] = (None, *labels)
+        self.entries = len(rows)
+        self.load_seconds = load_seconds
+
+    def covers(self, qid: int) -> bool:
+        return qid < len(self.codes)
+
+    def get(self, qid: int) -> str | None:
+        if qid >= len(self.codes):
+            return None
+        return self.labels[self.codes[qid]]
+
+    def lookup(self, qids: Iterable[int]) -> dict[int, str | None]:
+        return {qid: self.get(qid) for qid in qids}
+
+
+_lock = threading.Lock()
+_key: AnswerKey | None = None
+_checked_at = 0.0
+
+
+def _load(db: Session, generation: int) -> AnswerKey:
+    started = time.perf_counter()
+    max_id = db.execute(select(func.coalesce(func.max(Choice.question_id), 0))).scalar_one()
+    rows = db.execute(
+        select(Choice.question_id, Choice.label)
+        .where(Choice.is_correct == True)  # noqa: E712
+        .order_by(Choice.id)
+    ).all()
+    return AnswerKey(generation, rows, max_id, time.perf_counter() - started)
+
+
+def get_answer_key(db: Session, *, force_check: bool = False) -> AnswerKey:
+    """
+    Process-wide answer key; reloaded when the bank generation moves.
+    """
+    global _key, _checked_at
+    key = _key
+    if key and not force_check and time.monotonic() - _checked_at < BANK_REFRESH_SECONDS:
+        return key
+
+    # load outside the lock; only the swap is guarded (see question_bank.get_bank_index)
+    generation = get_bank_generation(db)
+    loaded = _load(db, generation) if key is None or key.generation != generation else None
+    with _lock:
+        if loaded is not None and (_key is None or _key.generation <= loaded.generation):
+            _key = loaded
+        _checked_at = time.monotonic()
+        return _key
+
+
+def correct_labels(db: Session, qids: list[int], *, force_check: bool = False) -> dict[int, str | None]:
+    """
+    Correct label per question id, from the shared snapshot when it is
+    current, else the in-memory key. force_check re-reads the bank generation
+    first, for results that are stored.
+    """
+    snap = current_snapshot(db, force_check=force_check)
+    if snap is not None and all(snap.covers(qid) for qid in qids):
+        return {qid: snap.correct_label(qid) for qid in qids}
+
+    key = get_answer_key(db, force_check=force_check)
+    if not all(key.covers(qid) for qid in qids):
+        # question newer than our key (imported by another process): recheck now
+        key = get_answer_key(db, force_check=True)
+    return key.lookup(qids)
+
+
+def invalidate_answer_key() -> None:
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
+
+
+def answer_key_stats() -> dict:
+    key = _key
+    if key is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "generation": key.generation,
+        "entries": key.entries,
+        "max_question_id": len(key.codes) - 1,
+        "bytes": len(key.codes),
+        "load_ms": round(key.load_seconds * 1000, 2),
+    }
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.models import AttemptMode, ExamAttempt
+
+# attempts whose header is kept per process; one per examinee in flight is plenty
+ATTEMPT_HEADER_CACHE_SIZE = int(os.getenv("ATTEMPT_HEADER_CACHE_SIZE", "10000"))
+# bounds how long another worker's submit (or materialization) can go unseen here
+ATTEMPT_HEADER_TTL_SECONDS = float(os.getenv("ATTEMPT_HEADER_TTL_SECONDS", "60"))
+
+
+class AttemptHeader(NamedTuple):
+    """
+    The fields attempt routes check on every call. Everything but submitted_at
+    and the seed pair is fixed at start; stands in for ExamAttempt wherever only
+    these are read (ownership, timer, slot resolution).
+    """
+    id: int
+    user_id: int | None
+    mode: AttemptMode
+    exam_name: str | None
+    question_count: int
+    time_limit_seconds: int | None
+    started_at: datetime
+    submitted_at: datetime | None
+    selection_seed: int | None
+    bank_version: str | None
+
+
+_FIELDS = [getattr(ExamAttempt, name) for name in AttemptHeader._fields]
+
+_headers = LRUCache(ATTEMPT_HEADER_CACHE_SIZE, ttl=ATTEMPT_HEADER_TTL_SECONDS)
+
+
+def header_of(attempt: ExamAttempt) -> AttemptHeader:
+    return AttemptHeader(*(getattr(attempt, name) for name in AttemptHeader._fields))
+
+
+def get_attempt_header(db: Session, attempt_id: int) -> AttemptHeader | None:
+    header = _headers.get(attempt_id)
+    if header is not None:
+        return header
+    row = db.execute(select(*_FIELDS).where(ExamAttempt.id == attempt_id)).first()
+    if row is None:
+        return None
+    header = AttemptHeader(*row)
+    _headers.set(attempt_id, header)
+    return header
+
+
+def remember_attempt_header(header: AttemptHeader) -> None:
+    # write-through after a change this process committed (submit)
+    _headers.set(header.id, header)
+
+
+def forget_attempt_header(attempt_id: int) -> None:
+    _headers.pop(attempt_id)
+
+
+def attempt_header_stats() -> dict:
+    stats = _headers.stats()
+    stats["ttl_seconds"] = ATTEMPT_HEADER_TTL_SECONDS
+    return stats
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import zlib
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.models import AttemptPoolEntry
+from app.services.question_bank import BankIndex, get_bank_index
+
+log = logging.getLogger(__name__)
+
+ATTEMPT_POOL_ENABLED = os.getenv("ATTEMPT_POOL_ENABLED", "0") == "1"
+# refill a (exam_name, question_count) pool when it drops below LOW, up to HIGH
+ATTEMPT_POOL_LOW = int(os.getenv("ATTEMPT_POOL_LOW", "20"))
+ATTEMPT_POOL_HIGH = int(os.getenv("ATTEMPT_POOL_HIGH", "100"))
+ATTEMPT_POOL_INTERVAL_SECONDS = float(os.getenv("ATTEMPT_POOL_INTERVAL_SECONDS", "5"))
+# rows written per refill transaction
+ATTEMPT_POOL_BATCH = 20
+# keys outside ATTEMPT_POOL_TARGETS that traffic asked for: produced for too,
+# but only this many per worker, each until it goes unrequested for the TTL
+ATTEMPT_POOL_LEARNED_KEYS = int(os.getenv("ATTEMPT_POOL_LEARNED_KEYS", "8"))
+ATTEMPT_POOL_LEARNED_TTL_SECONDS = float(os.getenv("ATTEMPT_POOL_LEARNED_TTL_SECONDS", "3600"))
+
+PoolKey = tuple[str | None, int]
+
+_lock = threading.Lock()
+_learned = LRUCache(ATTEMPT_POOL_LEARNED_KEYS, ttl=ATTEMPT_POOL_LEARNED_TTL_SECONDS)
+_stats = {"hits": 0, "misses": 0, "produced": 0, "discarded_stale": 0}
+
+
+def _parse_targets(raw: str) -> set[PoolKey]:
+    """
+    "CA Salesperson:150;CA Broker:150" -> {("CA Salesperson", 150), ("CA Broker", 150)}
+    """
+    out: set[PoolKey] = set()
+    for item in raw.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, count = item.rpartition(":")
+        out.add((name.strip() or None, int(count)))
+    return out
+
+
+_targets: frozenset[PoolKey] = frozenset(_parse_targets(os.getenv("ATTEMPT_POOL_TARGETS", "")))
+
+
+def _pool_keys() -> list[PoolKey]:
+    return sorted(_targets.union(_learned.keys()), key=lambda k: (k[0] or "", k[1]))
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def claim_question_set(db: Session, index: BankIndex, question_count: int) -> list[int] | None:
+    """
+    Take one pre-generated set for (exam_name, question_count) in a single
+    DELETE ... RETURNING. None when the pool is empty (caller generates inline).
+    """
+    key = (index.exam_name, question_count)
+    if key not in _targets:
+        # produce for it while it keeps being asked for (bounded, see ATTEMPT_POOL_LEARNED_KEYS)
+        _learned.set(key, True)
+
+    pick = (
+        select(AttemptPoolEntry.id)
+        .where(AttemptPoolEntry.exam_name == index.exam_name)
+        .where(AttemptPoolEntry.question_count == question_count)
+        .where(AttemptPoolEntry.bank_version == index.version)
+        .order_by(AttemptPoolEntry.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    question_ids = db.execute(
+        delete(AttemptPoolEntry).where(AttemptPoolEntry.id == pick).returning(AttemptPoolEntry.question_ids)
+    ).scalar_one_or_none()
+
+    _count("hits" if question_ids else "misses")
+    return list(question_ids) if question_ids else None
+
+
+def refill(db: Session, exam_name: str | None, question_count: int, *, to_high: bool = False) -> int:
+    """
+    Produce one batch of sets if the pool is below the low watermark (or, with
+    to_high, anywhere below the high one). Returns the number of sets produced.
+    """
+    # only one producer per key across workers; the lock ends with the transaction
+    lock_id = zlib.crc32(f"attempt_pool:{exam_name}:{question_count}".encode("utf-8"))
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": lock_id}).scalar_one():
+        db.rollback()
+        return 0
+
+    index = get_bank_index(db, exam_name)
+    if not index.topic_counts:
+        db.rollback()
+        return 0
+
+    stale = db.execute(
+        delete(AttemptPoolEntry)
+        .where(AttemptPoolEntry.exam_name == exam_name)
+        .where(AttemptPoolEntry.question_count == question_count)
+        .where(AttemptPoolEntry.bank_version != index.version)
+    ).rowcount
+    if stale:
+        with _lock:
+            _stats["discarded_stale"] += stale
+
+    level = db.execute(
+        select(func.count())
+        .select_from(AttemptPoolEntry)
+        .where(AttemptPoolEntry.exam_name == exam_name)
+        .where(AttemptPoolEntry.question_count == question_count)
+    ).scalar_one()
+    if level >= (ATTEMPT_POOL_HIGH if to_high else ATTEMPT_POOL_LOW):
+        db.commit()
+        return 0
+
+    # local import: exam_flow imports this module for the claim path
+    from app.services.exam_flow import select_balanced
+
+    produced = 0
+    for _ in range(min(ATTEMPT_POOL_BATCH, ATTEMPT_POOL_HIGH - level)):
+        try:
+            ids = select_balanced(index, question_count)
+        except ValueError:
+            break  # bank too small for this count
+        db.add(
+            AttemptPoolEntry(
+                exam_name=exam_name,
+                question_count=question_count,
+                bank_version=index.version,
+                question_ids=ids,
+            )
+        )
+        produced += 1
+    db.commit()
+
+    with _lock:
+        _stats["produced"] += produced
+    return produced
+
+
+def pool_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    keys = _pool_keys()
+    served = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / served, 4) if served else None
+    stats["enabled"] = ATTEMPT_POOL_ENABLED
+    stats["low_watermark"] = ATTEMPT_POOL_LOW
+    stats["high_watermark"] = ATTEMPT_POOL_HIGH
+    stats["keys"] = [{"exam_name": name, "question_count": count} for name, count in keys]
+    return stats
+
+
+class AttemptPoolWorker:
+    """
+    Background producer: every interval, refill each known (exam_name, question_count).
+    """
+
+    def __init__(self, session_factory, interval: float = ATTEMPT_POOL_INTERVAL_SECONDS):
+        self._session_factory = session_factory
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="attempt-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self._interval + 5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for exam_name, question_count in _pool_keys():
+                try:
+                    with self._session_factory() as db:
+                        # once a key dips below LOW, keep filling it up to HIGH
+                        produced = refill(db, exam_name, question_count)
+                        while produced and not self._stop.is_set():
+                            produced = refill(db, exam_name, question_count, to_high=True)
+                except Exception:
+                    log.exception("attempt pool refill failed for %s/%s", exam_name, question_count)
+            self._stop.wait(self._interval)
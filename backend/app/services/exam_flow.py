@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import os
 import random
-from datetime import datetime, timezone
-from sqlalchemy import select, func
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from typing import Iterable, NamedTuple
+from sqlalchemy import func, insert, select, or_, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models import (
-    Question,
     ExamAttempt,
     ExamAttemptQuestion,
+    ExamAttemptTopicScore,
     AttemptMode,
 )
+from app.cache import LRUCache
+from app.services.attempt_headers import AttemptHeader, forget_attempt_header
+from app.services.attempt_pool import ATTEMPT_POOL_ENABLED, claim_question_set
+from app.services.question_bank import BankIndex, get_bank_index, get_index_by_version, lock_bank_generation
 
 
 PASSING_PERCENT = 70
@@ -19,37 +28,58 @@ DEFAULT_QUESTION_COUNT = 150
 # pick something reasonable; you can make it configurable
 DEFAULT_TIMED_SECONDS = 150 * 60  # 150 minutes
 
+# "rows": lock each attempt's set in exam_attempt_questions (default)
+# "seed": store a selection seed + bank version and derive positions on read
+ATTEMPT_STORAGE_MODE = os.getenv("ATTEMPT_STORAGE_MODE", "rows")
 
-def _compute_topic_quota(topic_counts: dict[str, int], total: int) -> dict[str, int]:
+
+def _apportion(counts: dict, total: int, minimum: int = 1) -> dict:
     """
-    Proportional allocation with small balancing pass.
+    Largest-remainder (Hamilton) split of `total` proportional to `counts`.
+    Keys that round below `minimum` are raised to it and the difference is
+    taken from the largest quotas, so the sum is always exact (unless there
+    are more keys than total allows, in which case everyone gets the minimum).
     """
-    topics = list(topic_counts.keys())
-    if not topics:
+    keys = list(counts.keys())
+    if not keys:
         return {}
+    if total <= minimum * len(keys):
+        return {k: minimum for k in keys}
+
+    weight = sum(counts.values())
+    quota = {}
+    remainders = []
+    for i, k in enumerate(keys):
+        share, rem = divmod(total * counts[k], weight)
+        quota[k] = share
+        remainders.append((rem, counts[k], -i, k))
+
+    # hand out what flooring dropped: largest remainder first, then larger bucket
+    leftover = total - sum(quota.values())
+    for _rem, _cnt, _i, k in sorted(remainders, reverse=True)[:leftover]:
+        quota[k] += 1
+
+    deficit = sum(max(0, minimum - q) for q in quota.values())
+    if deficit:
+        for k in keys:
+            quota[k] = max(quota[k], minimum)
+        # the largest quotas can always absorb it since total > minimum * len(keys)
+        donors = sorted(keys, key=lambda k: (quota[k], counts[k]), reverse=True)
+        i = 0
+        while deficit:
+            k = donors[i % len(donors)]
+            if quota[k] > minimum:
+                quota[k] -= 1
+                deficit -= 1
+            i += 1
+    return quota
 
-    total_bank = sum(topic_counts.values())
-    # initial proportional
-    quota = {t: max(1, round(total * (topic_counts[t] / total_bank))) for t in topics}
-
-    # fix sum drift
-    diff = total - sum(quota.values())
-    # distribute diff by largest counts first
-    topics_sorted = sorted(topics, key=lambda t: topic_counts[t], reverse=True)
-
-    i = 0
-    while diff != 0 and topics_sorted:
-        t = topics_sorted[i % len(topics_sorted)]
-        if diff > 0:
-            quota[t] += 1
-            diff -= 1
-        else:
-            if quota[t] > 1:
-                quota[t] -= 1
-                diff += 1
-        i += 1
 
-    return quota
+def _compute_topic_quota(topic_counts: dict[str, int], total: int) -> dict[str, int]:
+    """
+    Proportional allocation, at least one question per topic.
+    """
+    return _apportion(topic_counts, total)
 
 
 def _compute_subtopic_quota(
@@ -63,146 +93,653 @@ def _compute_subtopic_quota(
     quota: dict[tuple[str | None, str | None], int] = {}
 
     # group subtopics by topic
-    by_topic: dict[str, list[tuple[tuple[str | None, str | None], int]]] = {}
+    by_topic: dict[str, dict[tuple[str | None, str | None], int]] = {}
     for (topic, subtopic), cnt in subtopic_counts.items():
         if topic is None:
             continue
-        by_topic.setdefault(topic, []).append(((topic, subtopic), cnt))
+        by_topic.setdefault(topic, {})[(topic, subtopic)] = cnt
 
     for topic, t_quota in topic_quota.items():
-        items = by_topic.get(topic, [])
-        if not items:
-            continue
-
-        total_cnt = sum(cnt for _, cnt in items)
-        # initial proportional per subtopic
-        for key, cnt in items:
-            quota[key] = max(1, round(t_quota * (cnt / total_cnt)))
-
-        # fix drift inside this topic
-        drift = t_quota - sum(quota[k] for k, _ in items)
-        keys_sorted = sorted(items, key=lambda kv: kv[1], reverse=True)
-        i = 0
-        while drift != 0 and keys_sorted:
-            key = keys_sorted[i % len(keys_sorted)][0]
-            if drift > 0:
-                quota[key] += 1
-                drift -= 1
-            else:
-                if quota[key] > 1:
-                    quota[key] -= 1
-                    drift += 1
-            i += 1
+        quota.update(_apportion(by_topic.get(topic, {}), t_quota))
 
     return quota
 
 
-def _pick_question_ids_for_bucket(db: Session, topic: str, subtopic: str | None, limit: int) -> list[int]:
-    stmt = (
-        select(Question.id)
-        .where(Question.topic == topic)
-        .where(Question.subtopic == subtopic)
-        .order_by(func.random())
-        .limit(limit)
-    )
-    return list(db.execute(stmt).scalars().all())
+def _balanced_quota(index: BankIndex, question_count: int) -> dict[tuple[str | None, str | None], int]:
+    """
+    (topic, subtopic) quotas for this bank, memoized on the index so they are
+    recomputed only when the bank changes.
+    """
+    quota = index.quotas.get(question_count)
+    if quota is None:
+        topic_quota = _compute_topic_quota(index.topic_counts, question_count)
+        quota = _compute_subtopic_quota(index.subtopic_counts, topic_quota)
+        index.quotas[question_count] = quota
+    return quota
 
 
-def create_attempt_with_balanced_questions(
+def insert_attempt_questions(
     db: Session,
-    *,
-    mode: AttemptMode,
-    exam_name: str | None,
-    question_count: int = DEFAULT_QUESTION_COUNT,
-    user_id: int,
-    time_limit_seconds: int | None = None,
-) -> ExamAttempt:
+    attempt_id: int,
+    picked: list[tuple[int, str | None, str | None]],
+) -> None:
     """
-    Creates attempt and locks a balanced randomized set in exam_attempt_questions.
+    Bulk-insert the locked question set in position order.
+    picked is [(question_id, topic, subtopic), ...]; one INSERT statement for all rows.
     """
-    if mode == AttemptMode.timed and time_limit_seconds is None:
-        time_limit_seconds = DEFAULT_TIMED_SECONDS
-    if mode == AttemptMode.practice:
-        time_limit_seconds = None
+    if not picked:
+        return
+    rows = [
+        {"attempt_id": attempt_id, "question_id": qid, "position": i, "topic": t, "subtopic": s}
+        for i, (qid, t, s) in enumerate(picked, start=1)
+    ]
+    db.execute(insert(ExamAttemptQuestion).values(rows))
 
-    # 1) Get counts by topic (optionally filter by exam_name if you want separate banks)
-    base = select(Question.topic, func.count(Question.id)).group_by(Question.topic)
-    if exam_name:
-        base = base.where(Question.exam_name == exam_name)
 
-    topic_rows = db.execute(base).all()
-    topic_counts = {t: c for (t, c) in topic_rows if t is not None}
-    if not topic_counts:
-        raise ValueError("No questions found for the selected exam_name/topic set")
+def _score_key(topic: str | None, subtopic: str | None = None) -> tuple[str, str]:
+    return topic or "Unknown", subtopic or ""
 
-    topic_quota = _compute_topic_quota(topic_counts, question_count)
 
-    # 2) Counts by (topic, subtopic)
-    sub_base = select(Question.topic, Question.subtopic, func.count(Question.id)).group_by(Question.topic, Question.subtopic)
-    if exam_name:
-        sub_base = sub_base.where(Question.exam_name == exam_name)
+def insert_topic_scores(db: Session, attempt_id: int, topics: Iterable[tuple[str | None, str | None]]) -> None:
+    """
+    Zeroed running counters, one row per (topic, subtopic), with its question count.
+    """
+    totals = Counter(_score_key(t, s) for t, s in topics)
+    if not totals:
+        return
+    db.execute(
+        insert(ExamAttemptTopicScore).values(
+            [
+                {"attempt_id": attempt_id, "topic": t, "subtopic": s, "total": n, "answered": 0, "correct": 0}
+                for (t, s), n in totals.items()
+            ]
+        )
+    )
 
-    sub_rows = db.execute(sub_base).all()
-    sub_counts = {(t, s): c for (t, s, c) in sub_rows if t is not None}
 
-    sub_quota = _compute_subtopic_quota(sub_counts, topic_quota)
+def select_balanced(index: BankIndex, question_count: int, rng=random) -> list[int]:
+    """
+    Balanced pick of question ids, already shuffled into position order.
+    Deterministic for a given index version and seeded rng.
+    """
+    # 1-2) Topic quota split across subtopics; counts come from the in-memory index
+    sub_quota = _balanced_quota(index, question_count)
 
-    # 3) Pick IDs bucket by bucket
+    # 3) Pick IDs bucket by bucket (in memory, O(quota) per bucket)
     picked_ids: list[int] = []
     for (topic, subtopic), q in sub_quota.items():
         if topic is None:
             continue
-        ids = _pick_question_ids_for_bucket(db, topic, subtopic, q)
-        picked_ids.extend(ids)
+        picked_ids.extend(index.sample_bucket(topic, subtopic, q, rng))
 
     # 4) De-dup and fill/trim to exact count
     picked_ids = list(dict.fromkeys(picked_ids))  # stable unique
     if len(picked_ids) < question_count:
         # Fill the remainder from anywhere (still within exam_name filter)
         remaining = question_count - len(picked_ids)
-        filler_stmt = select(Question.id)
-        if exam_name:
-            filler_stmt = filler_stmt.where(Question.exam_name == exam_name)
-        filler_stmt = filler_stmt.where(Question.id.not_in(picked_ids)).order_by(func.random()).limit(remaining)
-        picked_ids.extend(list(db.execute(filler_stmt).scalars().all()))
+        picked_ids.extend(index.sample_excluding(set(picked_ids), remaining, rng))
 
     if len(picked_ids) > question_count:
-        random.shuffle(picked_ids)
+        rng.shuffle(picked_ids)
         picked_ids = picked_ids[:question_count]
 
     if len(picked_ids) != question_count:
         raise ValueError(f"Unable to assemble {question_count} questions (got {len(picked_ids)})")
 
+    rng.shuffle(picked_ids)
+    return picked_ids
+
+
+def create_attempt_with_balanced_questions(
+    db: Session,
+    *,
+    mode: AttemptMode,
+    exam_name: str | None,
+    question_count: int = DEFAULT_QUESTION_COUNT,
+    user_id: int,
+    time_limit_seconds: int | None = None,
+) -> ExamAttempt:
+    """
+    Creates attempt and locks a balanced randomized set, either as rows in
+    exam_attempt_questions or (ATTEMPT_STORAGE_MODE=seed) as a seed + bank version.
+    """
+    if mode == AttemptMode.timed and time_limit_seconds is None:
+        time_limit_seconds = DEFAULT_TIMED_SECONDS
+    if mode == AttemptMode.practice:
+        time_limit_seconds = None
+
+    index = get_bank_index(db, exam_name)
+    if not index.topic_counts:
+        raise ValueError("No questions found for the selected exam_name/topic set")
+
+    seed = None
+    # A seed only replays while its bank version is known. Refuse it when the
+    # index is behind the bank, and share-lock the generation so no bank change
+    # (and its materialize pass) can slip in before this attempt commits.
+    if ATTEMPT_STORAGE_MODE == "seed" and lock_bank_generation(db) == index.generation:
+        seed = random.getrandbits(63)
+        picked_ids = select_balanced(index, question_count, random.Random(seed))
+    else:
+        picked_ids = None
+        if ATTEMPT_POOL_ENABLED:
+            picked_ids = claim_question_set(db, index, question_count)
+        if picked_ids is None:
+            picked_ids = select_balanced(index, question_count)
+
     # 5) Create attempt
+    started_at = datetime.now(timezone.utc)
     attempt = ExamAttempt(
         user_id=user_id,
         mode=mode,
         exam_name=exam_name,
         question_count=question_count,
         time_limit_seconds=time_limit_seconds,
-        started_at=datetime.now(timezone.utc),
+        started_at=started_at,
+        deadline_at=started_at + timedelta(seconds=time_limit_seconds) if time_limit_seconds is not None else None,
+        selection_seed=seed,
+        bank_version=index.version if seed is not None else None,
+        correct_count=0,
+        answered_count=0,
     )
     db.add(attempt)
     db.flush()  # to get attempt.id
 
-    # 6) Fetch topic/subtopic for denormalization
-    meta_stmt = select(Question.id, Question.topic, Question.subtopic).where(Question.id.in_(picked_ids))
-    meta = {qid: (t, s) for (qid, t, s) in db.execute(meta_stmt).all()}
-
-    random.shuffle(picked_ids)
-    rows = []
-    for i, qid in enumerate(picked_ids, start=1):
-        t, s = meta.get(qid, (None, None))
-        rows.append(
-            ExamAttemptQuestion(
-                attempt_id=attempt.id,
-                question_id=qid,
-                position=i,
-                topic=t,
-                subtopic=s,
+    # 6) Lock the set with one multi-row INSERT; topic/subtopic come from the index.
+    # Virtual (seeded) attempts store nothing here; positions are derived on read.
+    picked = [(qid, *index.topic_of(qid)) for qid in picked_ids]
+    if seed is None:
+        insert_attempt_questions(db, attempt.id, picked)
+    insert_topic_scores(db, attempt.id, ((topic, sub) for _qid, topic, sub in picked))
+
+    # keep the loaded attributes after commit instead of re-selecting the row
+    db.expunge(attempt)
+    db.commit()
+    return attempt
+
+
+# ----------------------------
+# Resolving positions -> questions
+# ----------------------------
+
+class AttemptSlot(NamedTuple):
+    position: int
+    question_id: int
+    topic: str | None
+    subtopic: str | None
+
+
+class AttemptQuestionsUnavailable(Exception):
+    """
+    A virtual attempt's bank version is gone and its questions cannot be replayed.
+    """
+
+
+# derived slot lists for virtual attempts; safe to keep after materialization
+# since the stored rows are exactly what was derived
+_derived_slots = LRUCache(maxsize=int(os.getenv("DERIVED_SLOTS_CACHE_SIZE", "2048")))
+
+
+def _derive_slots(db: Session, attempt: ExamAttempt | AttemptHeader) -> list[AttemptSlot]:
+    slots = _derived_slots.get(attempt.id)
+    if slots is not None:
+        return slots
+
+    current = get_bank_index(db, attempt.exam_name)
+    index = get_index_by_version(db, attempt.exam_name, attempt.bank_version)
+    if index is None:
+        # a cached header can outlive materialization by another process
+        slots = _stored_slots(db, attempt.id)
+        if slots:
+            return slots
+        raise AttemptQuestionsUnavailable(f"Question set for attempt {attempt.id} is no longer available")
+
+    picked_ids = select_balanced(index, attempt.question_count, random.Random(attempt.selection_seed))
+    slots = [AttemptSlot(i, qid, *index.topic_of(qid)) for i, qid in enumerate(picked_ids, start=1)]
+
+    if index.version != current.version:
+        # bank moved on since the attempt started: pin the set as real rows.
+        # Not cached: if the caller rolls back, the next read pins it again.
+        _materialize(db, attempt, slots)
+    else:
+        _derived_slots.set(attempt.id, slots)
+    return slots
+
+
+def _materialize(db: Session, attempt: ExamAttempt | AttemptHeader, slots: list[AttemptSlot]) -> None:
+    # in a savepoint: callers read slots mid-transaction (some under a row lock),
+    # so this never ends their transaction; the rows land when the caller commits
+    try:
+        with db.begin_nested():
+            insert_attempt_questions(db, attempt.id, [(s.question_id, s.topic, s.subtopic) for s in slots])
+            db.execute(
+                update(ExamAttempt)
+                .where(ExamAttempt.id == attempt.id)
+                .values(selection_seed=None, bank_version=None)
             )
+    except IntegrityError:
+        pass  # another request materialized it first
+    forget_attempt_header(attempt.id)
+
+
+def is_virtual(attempt: ExamAttempt | AttemptHeader) -> bool:
+    return attempt.selection_seed is not None
+
+
+def _stored_slots(
+    db: Session,
+    attempt_id: int,
+    first: int | None = None,
+    last: int | None = None,
+) -> list[AttemptSlot]:
+    stmt = (
+        select(
+            ExamAttemptQuestion.position,
+            ExamAttemptQuestion.question_id,
+            ExamAttemptQuestion.topic,
+            ExamAttemptQuestion.subtopic,
+        )
+        .where(ExamAttemptQuestion.attempt_id == attempt_id)
+        .order_by(ExamAttemptQuestion.position.asc())
+    )
+    if first is not None:
+        stmt = stmt.where(ExamAttemptQuestion.position >= first)
+    if last is not None:
+        stmt = stmt.where(ExamAttemptQuestion.position <= last)
+    return [AttemptSlot(*r) for r in db.execute(stmt).all()]
+
+
+def attempt_slots(
+    db: Session,
+    attempt: ExamAttempt | AttemptHeader,
+    first: int | None = None,
+    last: int | None = None,
+) -> list[AttemptSlot]:
+    """
+    (position, question_id, topic, subtopic) for the attempt in position order,
+    optionally limited to positions first..last (inclusive).
+    """
+    if is_virtual(attempt):
+        slots = _derive_slots(db, attempt)
+        lo = max(first or 1, 1) - 1
+        hi = len(slots) if last is None else last
+        return slots[lo:hi]
+    return _stored_slots(db, attempt.id, first, last)
+
+
+def attempt_slot(db: Session, attempt: ExamAttempt | AttemptHeader, position: int) -> AttemptSlot | None:
+    if is_virtual(attempt):
+        slots = _derive_slots(db, attempt)
+        return slots[position - 1] if 1 <= position <= len(slots) else None
+    row = db.execute(
+        select(
+            ExamAttemptQuestion.position,
+            ExamAttemptQuestion.question_id,
+            ExamAttemptQuestion.topic,
+            ExamAttemptQuestion.subtopic,
         )
-    db.add_all(rows)
+        .where(ExamAttemptQuestion.attempt_id == attempt.id)
+        .where(ExamAttemptQuestion.position == position)
+    ).first()
+    return AttemptSlot(*row) if row else None
+
+
+def attempt_question_topics(
+    db: Session, attempt: ExamAttempt | AttemptHeader, question_ids: Iterable[int]
+) -> dict[int, tuple[str | None, str | None]]:
+    """
+    {question_id: (topic, subtopic)} for those of question_ids that belong to the attempt, in one query.
+    """
+    wanted = set(question_ids)
+    if is_virtual(attempt):
+        return {s.question_id: (s.topic, s.subtopic) for s in _derive_slots(db, attempt) if s.question_id in wanted}
+    stmt = (
+        select(ExamAttemptQuestion.question_id, ExamAttemptQuestion.topic, ExamAttemptQuestion.subtopic)
+        .where(ExamAttemptQuestion.attempt_id == attempt.id)
+        .where(ExamAttemptQuestion.question_id.in_(wanted))
+    )
+    return {qid: (topic, subtopic) for qid, topic, subtopic in db.execute(stmt).all()}
+
+
+# k.label = correct label of {question_id}: the newest is_correct choice, as in the answer key
+_CORRECT_CHOICE = """
+    LEFT JOIN LATERAL (
+        SELECT c.label
+        FROM choices c
+        WHERE c.question_id = {question_id} AND c.is_correct
+        ORDER BY c.id DESC
+        LIMIT 1
+    ) k ON true
+"""
+
+# Upsert the answers and move the running counters by the difference between
+# the old and new answer, in one statement. The CTEs all read the snapshot from
+# before the upsert, so `old` is the answer being replaced. The correct label
+# comes from choices, not a worker's cached key: counters are stored, and must
+# never disagree with the bank.
+_SAVE_ANSWERS_SQL = text(
+    f"""
+    WITH input AS (
+        SELECT *
+        FROM unnest(
+            CAST(:question_ids AS integer[]),
+            CAST(:labels AS varchar[]),
+            CAST(:topics AS varchar[]),
+            CAST(:subtopics AS varchar[])
+        ) AS t(question_id, selected_label, topic, subtopic)
+    ),
+    old AS (
+        SELECT a.question_id, a.selected_label
+        FROM exam_answers a
+        JOIN input i ON i.question_id = a.question_id
+        WHERE a.attempt_id = :attempt_id
+    ),
+    upsert AS (
+        INSERT INTO exam_answers (attempt_id, question_id, selected_label, answered_at)
+        SELECT :attempt_id, question_id, selected_label, :answered_at FROM input
+        ON CONFLICT ON CONSTRAINT uq_answer_attempt_question
+        DO UPDATE SET selected_label = EXCLUDED.selected_label, answered_at = EXCLUDED.answered_at
+    ),
+    delta AS (
+        SELECT i.topic, i.subtopic,
+               sum(COALESCE(i.selected_label = k.label, false)::int
+                   - COALESCE(o.selected_label = k.label, false)::int) AS correct,
+               sum((o.question_id IS NULL)::int) AS answered
+        FROM input i
+        LEFT JOIN old o ON o.question_id = i.question_id
+        {_CORRECT_CHOICE.format(question_id="i.question_id")}
+        GROUP BY i.topic, i.subtopic
+    ),
+    topic_scores AS (
+        UPDATE exam_attempt_topic_scores s
+        SET correct = s.correct + d.correct, answered = s.answered + d.answered
+        FROM delta d
+        WHERE s.attempt_id = :attempt_id AND s.topic = d.topic AND s.subtopic = d.subtopic
+    )
+    UPDATE exam_attempts
+    SET correct_count = correct_count + (SELECT COALESCE(sum(correct), 0) FROM delta),
+        answered_count = answered_count + (SELECT COALESCE(sum(answered), 0) FROM delta)
+    WHERE id = :attempt_id
+    """
+)
+
+
+def save_answers(db: Session, attempt: ExamAttempt | AttemptHeader, answers: list[tuple[int, str]]) -> int:
+    """
+    Validate and upsert [(question_id, label), ...] for an open attempt:
+    one membership query plus one statement that upserts the answers and
+    updates the running score. Later entries for the same question win.
+    Returns the number of rows written.
+
+    The attempt row must be locked (FOR UPDATE) in this transaction, so
+    concurrent saves to one attempt apply their counter deltas in turn.
+    """
+    latest = dict(answers)
+    if not latest:
+        return 0
+
+    topics = attempt_question_topics(db, attempt, latest)
+    if len(topics) != len(latest):
+        raise ValueError("Question does not belong to this attempt")
+
+    qids = list(latest)
+    keys = [_score_key(*topics[qid]) for qid in qids]
+    db.execute(
+        _SAVE_ANSWERS_SQL,
+        {
+            "attempt_id": attempt.id,
+            "answered_at": datetime.now(timezone.utc),
+            "question_ids": qids,
+            "labels": [latest[qid] for qid in qids],
+            "topics": [topic for topic, _sub in keys],
+            "subtopics": [sub for _topic, sub in keys],
+        },
+    )
     db.commit()
-    db.refresh(attempt)
-    return attempt
+    return len(latest)
+
+
+class AttemptScore(NamedTuple):
+    correct: int
+    total: int
+    breakdown: dict[str, dict[str, int]]  # topic -> {"correct", "total"}
+
+
+def score_attempt(db: Session, attempt: ExamAttempt) -> AttemptScore:
+    """
+    Read the running counters; attempts without them are scored from their answers.
+    """
+    if attempt.correct_count is not None:
+        rows = db.execute(
+            select(
+                ExamAttemptTopicScore.topic,
+                func.sum(ExamAttemptTopicScore.correct),
+                func.sum(ExamAttemptTopicScore.total),
+            )
+            .where(ExamAttemptTopicScore.attempt_id == attempt.id)
+            .group_by(ExamAttemptTopicScore.topic)
+            .order_by(ExamAttemptTopicScore.topic)
+        ).all()
+        breakdown = {topic: {"correct": correct, "total": total} for topic, correct, total in rows}
+        return AttemptScore(attempt.correct_count, sum(b["total"] for b in breakdown.values()), breakdown)
+
+    correct = 0
+    breakdown: dict[str, dict[str, int]] = {}
+    for row in subtopic_scores_from_answers(db, attempt):
+        topic = breakdown.setdefault(row.topic, {"correct": 0, "total": 0})
+        topic["total"] += row.total
+        topic["correct"] += row.correct
+        correct += row.correct
+    return AttemptScore(correct, sum(b["total"] for b in breakdown.values()), breakdown)
+
+
+class SubtopicScore(NamedTuple):
+    topic: str
+    subtopic: str
+    answered: int
+    correct: int
+    total: int
+
+
+# Per-(topic, subtopic) scores straight from the answers, in one aggregate.
+# {slots} yields the attempt's (question_id, topic, subtopic): its stored rows,
+# or the derived slots of a virtual attempt passed in as arrays.
+_SCORE_FROM_ANSWERS = f"""
+    SELECT s.topic, s.subtopic,
+           count(a.id) AS answered,
+           count(*) FILTER (WHERE a.selected_label = k.label) AS correct,
+           count(*) AS total
+    FROM ({{slots}}) s
+    LEFT JOIN exam_answers a ON a.attempt_id = :attempt_id AND a.question_id = s.question_id
+    {_CORRECT_CHOICE.format(question_id="s.question_id")}
+    GROUP BY s.topic, s.subtopic
+    ORDER BY s.topic, s.subtopic
+"""
+_SCORE_STORED_SLOTS = text(
+    _SCORE_FROM_ANSWERS.format(
+        slots="""
+        SELECT question_id, COALESCE(topic, 'Unknown') AS topic, COALESCE(subtopic, '') AS subtopic
+        FROM exam_attempt_questions
+        WHERE attempt_id = :attempt_id
+        """
+    )
+)
+_SCORE_DERIVED_SLOTS = text(
+    _SCORE_FROM_ANSWERS.format(
+        slots="""
+        SELECT *
+        FROM unnest(
+            CAST(:question_ids AS integer[]),
+            CAST(:topics AS varchar[]),
+            CAST(:subtopics AS varchar[])
+        ) AS t(question_id, topic, subtopic)
+        """
+    )
+)
+
+
+def subtopic_scores_from_answers(db: Session, attempt: ExamAttempt) -> list[SubtopicScore]:
+    """
+    Counters recomputed from the attempt's answers, for attempts that have none stored.
+    """
+    if not is_virtual(attempt):
+        rows = db.execute(_SCORE_STORED_SLOTS, {"attempt_id": attempt.id}).all()
+    else:
+        slots = attempt_slots(db, attempt)
+        keys = [_score_key(s.topic, s.subtopic) for s in slots]
+        rows = db.execute(
+            _SCORE_DERIVED_SLOTS,
+            {
+                "attempt_id": attempt.id,
+                "question_ids": [s.question_id for s in slots],
+                "topics": [topic for topic, _sub in keys],
+                "subtopics": [sub for _topic, sub in keys],
+            },
+        ).all()
+    return [SubtopicScore(*row) for row in rows]
+
+
+# Score a counter-tracked attempt and close it in one round trip. The caller
+# holds the row lock, so the counters read here are final. Rounds half to even
+# (float8 round), like Python's round(). Nothing is updated when there are no
+# questions; score_percent comes back NULL then.
+_FINALIZE_ATTEMPT_SQL = text(
+    """
+    WITH topics AS (
+        SELECT topic, sum(correct) AS correct, sum(total) AS total
+        FROM exam_attempt_topic_scores
+        WHERE attempt_id = :attempt_id
+        GROUP BY topic
+    ),
+    totals AS (
+        SELECT COALESCE(sum(correct), 0) AS correct, COALESCE(sum(total), 0) AS total
+        FROM topics
+    ),
+    finalize AS (
+        UPDATE exam_attempts a
+        SET submitted_at = :submitted_at,
+            score_percent = round((totals.correct::float8 / totals.total) * 100)::int,
+            passed = round((totals.correct::float8 / totals.total) * 100) >= :passing_percent
+        FROM totals
+        WHERE a.id = :attempt_id AND totals.total > 0
+        RETURNING a.score_percent, a.passed
+    )
+    SELECT t.topic, t.correct, t.total, f.score_percent, f.passed
+    FROM topics t
+    LEFT JOIN finalize f ON true
+    ORDER BY t.topic
+    """
+)
+
+
+def finalize_attempt(db: Session, attempt: ExamAttempt, submitted_at: datetime) -> AttemptScore:
+    """
+    Score a locked, open attempt and mark it submitted (score_percent, passed,
+    submitted_at). An attempt with no questions is left open (score.total == 0).
+    Caller commits.
+    """
+    if attempt.correct_count is None:
+        score = score_attempt(db, attempt)
+        if score.total:
+            attempt.score_percent = int(round((score.correct / score.total) * 100))
+            attempt.passed = attempt.score_percent >= PASSING_PERCENT
+            attempt.submitted_at = submitted_at
+        return score
+
+    rows = db.execute(
+        _FINALIZE_ATTEMPT_SQL,
+        {"attempt_id": attempt.id, "submitted_at": submitted_at, "passing_percent": PASSING_PERCENT},
+    ).all()
+    breakdown = {r.topic: {"correct": r.correct, "total": r.total} for r in rows}
+    score = AttemptScore(sum(r.correct for r in rows), sum(r.total for r in rows), breakdown)
+    if score.total:
+        # already written by the statement; keep the ORM from writing them again
+        set_committed_value(attempt, "score_percent", rows[0].score_percent)
+        set_committed_value(attempt, "passed", rows[0].passed)
+        set_committed_value(attempt, "submitted_at", submitted_at)
+    return score
+
+
+# Open, counter-tracked attempts that hold any of :question_ids, row-locked in id
+# order (the order save_answers and submit take them one at a time).
+_LOCK_ATTEMPTS_WITH_QUESTIONS = text(
+    """
+    SELECT e.id
+    FROM exam_attempts e
+    WHERE e.submitted_at IS NULL AND e.correct_count IS NOT NULL
+      AND EXISTS (
+          SELECT 1 FROM exam_attempt_questions aq
+          WHERE aq.attempt_id = e.id AND aq.question_id = ANY(CAST(:question_ids AS integer[]))
+      )
+    ORDER BY e.id
+    FOR UPDATE OF e
+    """
+)
+# Recount `correct` for :attempt_ids from their answers and the current choices.
+# `answered` and `total` do not depend on the answer key and are left alone.
+_RESCORE_ATTEMPTS = text(
+    f"""
+    WITH scores AS (
+        SELECT aq.attempt_id,
+               COALESCE(aq.topic, 'Unknown') AS topic,
+               COALESCE(aq.subtopic, '') AS subtopic,
+               count(*) FILTER (WHERE a.selected_label = k.label) AS correct
+        FROM exam_attempt_questions aq
+        LEFT JOIN exam_answers a ON a.attempt_id = aq.attempt_id AND a.question_id = aq.question_id
+        {_CORRECT_CHOICE.format(question_id="aq.question_id")}
+        WHERE aq.attempt_id = ANY(CAST(:attempt_ids AS integer[]))
+        GROUP BY 1, 2, 3
+    ),
+    topic_scores AS (
+        UPDATE exam_attempt_topic_scores s
+        SET correct = sc.correct
+        FROM scores sc
+        WHERE s.attempt_id = sc.attempt_id AND s.topic = sc.topic AND s.subtopic = sc.subtopic
+    )
+    UPDATE exam_attempts e
+    SET correct_count = t.correct
+    FROM (SELECT attempt_id, sum(correct) AS correct FROM scores GROUP BY attempt_id) t
+    WHERE e.id = t.attempt_id
+    """
+)
+
+
+def rescore_open_attempts(db: Session, question_ids: Iterable[int]) -> int:
+    """
+    Bring the running scores of open attempts in line with the choices after
+    the correct answer of question_ids changed. Slots are read from stored
+    rows, so run materialize_virtual_attempts first. Returns the number of
+    attempts rescored. Caller commits.
+    """
+    qids = list(question_ids)
+    if not qids:
+        return 0
+    attempt_ids = db.execute(_LOCK_ATTEMPTS_WITH_QUESTIONS, {"question_ids": qids}).scalars().all()
+    if attempt_ids:
+        db.execute(_RESCORE_ATTEMPTS, {"attempt_ids": list(attempt_ids)})
+    return len(attempt_ids)
+
+
+def materialize_virtual_attempts(db: Session, exam_names: Iterable[str] | None = None) -> int:
+    """
+    Write rows for every virtual attempt that replays against the current bank.
+    Run before changing questions; afterwards their version would no longer match.
+    exam_names=None covers every exam. Attempts without an exam_name draw from the
+    whole bank, so they are always included. Caller commits.
+    """
+    stmt = select(ExamAttempt).where(ExamAttempt.selection_seed.is_not(None))
+    if exam_names is not None:
+        stmt = stmt.where(or_(ExamAttempt.exam_name.in_(list(exam_names)), ExamAttempt.exam_name.is_(None)))
+
+    count = 0
+    for attempt in db.scalars(stmt).all():
+        index = get_index_by_version(db, attempt.exam_name, attempt.bank_version)
+        if index is None:
+            continue
+        picked_ids = select_balanced(index, attempt.question_count, random.Random(attempt.selection_seed))
+        insert_attempt_questions(db, attempt.id, [(qid, *index.topic_of(qid)) for qid in picked_ids])
+        attempt.selection_seed = None
+        attempt.bank_version = None
+        forget_attempt_header(attempt.id)
+        count += 1
+    db.flush()
+    return count
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import exists, or_, select, text
+from sqlalchemy.orm import Session
+
+from app.models import ExamAttempt, ExamAttemptQuestion
+from app.services.attempt_headers import forget_attempt_header
+from app.services.exam_flow import PASSING_PERCENT, finalize_attempt
+from app.services.user_stats import record_counted_submissions, record_submission
+
+log = logging.getLogger(__name__)
+
+EXPIRY_SWEEP_ENABLED = os.getenv("EXPIRY_SWEEP_ENABLED", "1") == "1"
+EXPIRY_SWEEP_INTERVAL_SECONDS = float(os.getenv("EXPIRY_SWEEP_INTERVAL_SECONDS", "60"))
+# attempts finalized per transaction
+EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", "500"))
+# leave a client that submits right at the deadline time to get its request in
+EXPIRY_GRACE_SECONDS = int(os.getenv("EXPIRY_GRACE_SECONDS", "30"))
+
+_lock = threading.Lock()
+_stats = {"sweeps": 0, "finalized": 0, "failed": 0, "last_sweep_at": None}
+
+# One sweeper at a time across workers (the others skip the round), so batches
+# fold into their users' trends in deadline order.
+_SWEEP_LOCK_ID = zlib.crc32(b"expiry_sweeper")
+
+# Claim a batch of expired open attempts through ix_exam_attempts_open_deadline
+# and close them from their running counters in one statement. SKIP LOCKED
+# skips attempts being submitted right now (submit holds the row lock). They
+# are closed as of their deadline. Attempts with no questions to score are
+# left open, as submit leaves them (see finalize_attempt), and are not claimed
+# at all so they never hold up the batch.
+# round(float8) rounds half to even, like Python's round() in submit.
+_FINALIZE_EXPIRED = text(
+    """
+    WITH due AS (
+        SELECT e.id
+        FROM exam_attempts e
+        WHERE e.submitted_at IS NULL AND e.deadline_at IS NOT NULL AND e.deadline_at < :cutoff
+          AND e.correct_count IS NOT NULL
+          AND EXISTS (SELECT 1 FROM exam_attempt_topic_scores s WHERE s.attempt_id = e.id AND s.total > 0)
+        ORDER BY e.deadline_at
+        LIMIT :batch
+        FOR UPDATE OF e SKIP LOCKED
+    ),
+    totals AS (
+        SELECT s.attempt_id, sum(s.total) AS total
+        FROM exam_attempt_topic_scores s
+        JOIN due ON due.id = s.attempt_id
+        GROUP BY s.attempt_id
+    ),
+    scored AS (
+        SELECT t.attempt_id AS id,
+               round((a.correct_count::float8 / t.total) * 100)::int AS score_percent
+        FROM totals t
+        JOIN exam_attempts a ON a.id = t.attempt_id
+    )
+    UPDATE exam_attempts a
+    SET submitted_at = a.deadline_at,
+        score_percent = scored.score_percent,
+        passed = scored.score_percent >= :passing_percent
+    FROM scored
+    WHERE a.id = scored.id
+    RETURNING a.id, a.user_id, a.submitted_at
+    """
+)
+
+
+def _try_sweep_lock(db: Session) -> bool:
+    # held until the transaction ends
+    return db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _SWEEP_LOCK_ID}).scalar_one()
+
+
+def _finalize_untracked(db: Session, cutoff: datetime, batch: int) -> list[int]:
+    # attempts from before the running counters: scored from their answers, one
+    # by one, each in a savepoint so one that cannot be scored (say, a seeded
+    # attempt that no longer replays) is skipped instead of failing the batch.
+    # Stored attempts without question rows have nothing to score and stay open.
+    has_questions = or_(
+        ExamAttempt.selection_seed.is_not(None),
+        exists().where(ExamAttemptQuestion.attempt_id == ExamAttempt.id),
+    )
+    attempts = db.scalars(
+        select(ExamAttempt)
+        .where(ExamAttempt.submitted_at.is_(None))
+        .where(ExamAttempt.deadline_at < cutoff)
+        .where(ExamAttempt.correct_count.is_(None))
+        .where(has_questions)
+        .order_by(ExamAttempt.deadline_at)
+        .limit(batch)
+        .with_for_update(skip_locked=True)
+    ).all()
+    closed = []
+    for attempt in attempts:
+        attempt_id = attempt.id
+        try:
+            with db.begin_nested():
+                if not finalize_attempt(db, attempt, attempt.deadline_at).total:
+                    continue  # left open, as submit leaves it
+                record_submission(db, attempt)
+        except Exception:
+            log.exception("could not finalize expired attempt %s; skipped", attempt_id)
+            with _lock:
+                _stats["failed"] += 1
+            continue
+        closed.append(attempt_id)
+    return closed
+
+
+def finalize_expired_attempts(db: Session, batch: int = EXPIRY_SWEEP_BATCH) -> int:
+    """
+    Submit one batch of timed attempts whose deadline (plus grace) has passed,
+    and fold them into their users' stats. Commits. Returns how many were closed.
+    """
+    if not _try_sweep_lock(db):
+        db.rollback()
+        return 0  # another worker is sweeping
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=EXPIRY_GRACE_SECONDS)
+    rows = db.execute(
+        _FINALIZE_EXPIRED,
+        {"cutoff": cutoff, "batch": batch, "passing_percent": PASSING_PERCENT},
+    ).all()
+    # in deadline order, so a user's trend folds in the order the attempts ended
+    rows.sort(key=lambda r: (r.submitted_at, r.id))
+    record_counted_submissions(db, [(r.id, r.user_id, r.submitted_at) for r in rows])
+    db.commit()  # the set-based batch stands on its own
+    closed = [r.id for r in rows]
+
+    if len(closed) < batch and _try_sweep_lock(db):
+        closed += _finalize_untracked(db, cutoff, batch - len(closed))
+    db.commit()
+
+    for attempt_id in closed:
+        forget_attempt_header(attempt_id)
+    with _lock:
+        _stats["sweeps"] += 1
+        _stats["finalized"] += len(closed)
+        _stats["last_sweep_at"] = datetime.now(timezone.utc).isoformat()
+    return len(closed)
+
+
+class ExpirySweeper:
+    """
+    Background finalizer: every interval, close expired timed attempts in batches.
+    """
+
+    def __init__(self, session_factory, interval: float = EXPIRY_SWEEP_INTERVAL_SECONDS):
+        self._session_factory = session_factory
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="expiry-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self._interval + 5)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with self._session_factory() as db:
+                    closed = finalize_expired_attempts(db)
+                    # a full batch means there is more backlog
+                    while closed == EXPIRY_SWEEP_BATCH and not self._stop.is_set():
+                        closed = finalize_expired_attempts(db)
+            except Exception:
+                log.exception("expiry sweep failed")
+            self._stop.wait(self._interval)
+
+
+def expiry_sweep_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["enabled"] = EXPIRY_SWEEP_ENABLED
+    return stats
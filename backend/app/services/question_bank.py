@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.models import Question, QuestionBankState
+
+
+# How long a worker trusts its index before re-reading the bank generation.
+# Imports run in a separate process, so this bounds how stale an index can get.
+BANK_REFRESH_SECONDS = float(os.getenv("BANK_REFRESH_SECONDS", "30"))
+
+# Bump whenever exam_flow.select_balanced picks differently for the same seed,
+# so seeded attempts from older code fail loudly instead of replaying wrong.
+SELECTION_VERSION = 2
+
+BucketKey = tuple[str | None, str | None]
+
+
+class BankIndex:
+    """
+    Immutable snapshot of one exam's question ids, grouped by (topic, subtopic).
+
+    Ids are kept in compact int arrays so sampling a bucket is O(quota) and
+    /attempts/start never has to scan the questions table.
+    """
+
+    __slots__ = (
+        "exam_name",
+        "generation",
+        "version",
+        "buckets",
+        "topic_counts",
+        "subtopic_counts",
+        "all_ids",
+        "quotas",
+        "_keys",
+        "_key_of",
+    )
+
+    def __init__(self, exam_name: str | None, generation: int, rows: list[tuple[int, str | None, str | None]]):
+        self.exam_name = exam_name
+        self.generation = generation
+
+        grouped: dict[BucketKey, list[int]] = {}
+        all_ids = array("i")
+        # rows are ordered by id; _key_of[i] points at the (topic, subtopic) of all_ids[i]
+        keys: dict[BucketKey, int] = {}
+        key_of = array("I")
+        for qid, topic, subtopic in rows:
+            all_ids.append(qid)
+            key_of.append(keys.setdefault((topic, subtopic), len(keys)))
+            if topic is None:
+                # only reachable through the filler, same as the SQL version
+                continue
+            grouped.setdefault((topic, subtopic), []).append(qid)
+
+        self.all_ids = all_ids
+        self._keys = list(keys)
+        self._key_of = key_of
+        self.buckets: dict[BucketKey, array] = {key: array("i", ids) for key, ids in grouped.items()}
+        self.subtopic_counts: dict[BucketKey, int] = {key: len(ids) for key, ids in self.buckets.items()}
+
+        topic_counts: dict[str, int] = {}
+        for (topic, _subtopic), cnt in self.subtopic_counts.items():
+            topic_counts[topic] = topic_counts.get(topic, 0) + cnt
+        self.topic_counts = topic_counts
+        # question_count -> (topic, subtopic) quota, filled by exam_flow
+        self.quotas: dict[int, dict[BucketKey, int]] = {}
+
+        # Content hash: equal versions mean a seeded selection replays identically.
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((SELECTION_VERSION, exam_name, self._keys)).encode("utf-8"))
+        h.update(all_ids.tobytes())
+        h.update(key_of.tobytes())
+        self.version = h.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.all_ids)
+
+    def topic_of(self, qid: int) -> BucketKey:
+        i = bisect_left(self.all_ids, qid)
+        if i == len(self.all_ids) or self.all_ids[i] != qid:
+            return (None, None)
+        return self._keys[self._key_of[i]]
+
+    def sample_bucket(self, topic: str, subtopic: str | None, limit: int, rng=random) -> list[int]:
+        ids = self.buckets.get((topic, subtopic))
+        if not ids or limit <= 0:
+            return []
+        return rng.sample(ids, min(limit, len(ids)))
+
+    def sample_excluding(self, exclude: set[int], limit: int, rng=random) -> list[int]:
+        """
+        Random ids from the whole exam bank that are not in `exclude`.
+        """
+        available = len(self.all_ids) - len(exclude)
+        limit = min(limit, available)
+        if limit <= 0:
+            return []
+
+        # Rejection sampling is O(limit) while most of the bank is still free;
+        # fall back to an explicit candidate list when it is nearly exhausted.
+        if available >= 2 * limit:
+            out: list[int] = []
+            taken = set(exclude)
+            n = len(self.all_ids)
+            while len(out) < limit:
+                qid = self.all_ids[rng.randrange(n)]
+                if qid not in taken:
+                    taken.add(qid)
+                    out.append(qid)
+            return out
+
+        candidates = [qid for qid in self.all_ids if qid not in exclude]
+        return rng.sample(candidates, limit)
+
+
+class _Entry:
+    __slots__ = ("index", "checked_at")
+
+    def __init__(self, index: BankIndex):
+        self.index = index
+        self.checked_at = time.monotonic()
+
+
+# Superseded indexes are kept for a while so virtual attempts created against
+# them can still be resolved (and materialized).
+RETIRED_INDEXES_KEPT = 8
+# Live indexes per worker, one per exam_name asked for (the key comes from request bodies)
+BANK_INDEX_CACHE_SIZE = int(os.getenv("BANK_INDEX_CACHE_SIZE", "32"))
+
+_lock = threading.Lock()
+_indexes = LRUCache(BANK_INDEX_CACHE_SIZE)  # exam_name -> _Entry
+_retired: dict[str, BankIndex] = {}
+
+
+def get_bank_generation(db: Session) -> int:
+    return db.execute(select(QuestionBankState.generation).where(QuestionBankState.id == 1)).scalar_one_or_none() or 0
+
+
+def lock_bank_generation(db: Session) -> int:
+    """
+    The bank generation, share-locked until the caller's transaction ends:
+    a bank change (bump_bank_generation) waits for it, and vice versa.
+    """
+    return db.execute(
+        select(QuestionBankState.generation).where(QuestionBankState.id == 1).with_for_update(read=True)
+    ).scalar_one_or_none() or 0
+
+
+def bump_bank_generation(db: Session) -> None:
+    """
+    Mark the bank as changed so every worker rebuilds its index.
+    Runs inside the caller's transaction; call it before touching questions
+    (and before materialize_virtual_attempts) so its row lock holds off new
+    seeded attempts until commit.
+    """
+    db.execute(
+        update(QuestionBankState)
+        .where(QuestionBankState.id == 1)
+        .values(generation=QuestionBankState.generation + 1, updated_at=func.now())
+    )
+
+
+def invalidate_bank_index(exam_name: str | None = None) -> None:
+    with _lock:
+        if exam_name is None:
+            dropped = [_indexes.pop(key) for key in _indexes.keys()]
+        else:
+            # the all-exams index contains it too
+            dropped = [_indexes.pop(exam_name), _indexes.pop(None)]
+        for entry in filter(None, dropped):
+            _retire(entry.index)
+
+
+def _build_index(db: Session, exam_name: str | None, generation: int) -> BankIndex:
+    stmt = select(Question.id, Question.topic, Question.subtopic).order_by(Question.id)
+    if exam_name:
+        stmt = stmt.where(Question.exam_name == exam_name)
+    return BankIndex(exam_name, generation, db.execute(stmt).all())
+
+
+def get_bank_index(db: Session, exam_name: str | None) -> BankIndex:
+    """
+    Index for exam_name (None = whole bank). Rebuilt lazily when the bank
+    generation moves; otherwise served from memory. An exam with no questions
+    is not cached (nor retired), so unknown names cannot crowd out real ones.
+    """
+    key = exam_name or None
+    entry = _indexes.get(key)
+    if entry and time.monotonic() - entry.checked_at < BANK_REFRESH_SECONDS:
+        return entry.index
+
+    # Query before taking the lock, never while holding it: under DB_ASYNC the
+    # route bodies run as greenlets on the event-loop thread, and one parked on
+    # I/O inside the lock would block the next one (and with it the loop).
+    generation = get_bank_generation(db)
+    if entry and entry.index.generation == generation:
+        entry.checked_at = time.monotonic()
+        return entry.index
+    index = _build_index(db, key, generation)
+    if not index.topic_counts:
+        return index
+
+    with _lock:
+        entry = _indexes.get(key)
+        if entry and entry.index.generation >= generation:
+            # someone else got there first (or read a newer bank)
+            entry.checked_at = time.monotonic()
+            return entry.index
+        if entry and entry.index.version != index.version:
+            _retire(entry.index)
+        _indexes.set(key, _Entry(index))
+        return index
+
+
+def _retire(index: BankIndex) -> None:
+    _retired[index.version] = index
+    while len(_retired) > RETIRED_INDEXES_KEPT:
+        _retired.pop(next(iter(_retired)))
+
+
+def get_index_by_version(db: Session, exam_name: str | None, version: str) -> BankIndex | None:
+    """
+    The current index if it still has `version`, else a retained older one.
+    """
+    index = get_bank_index(db, exam_name)
+    if index.version == version:
+        return index
+    return _retired.get(version)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.services.question_bank import BANK_REFRESH_SECONDS, get_bank_generation
+from app.services.question_snapshot import QuestionContent, current_snapshot, load_question_contents
+
+# question DTOs kept per process; a few thousand covers the live bank
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "5000"))
+
+_cache = LRUCache(QUESTION_CACHE_SIZE)
+_lock = threading.Lock()
+_generation: int | None = None
+_checked_at = 0.0
+_stats = {"from_snapshot": 0, "from_db": 0, "flushes": 0}
+
+
+def _check_generation(db: Session, force: bool = False) -> None:
+    # imports edit questions in place from another process: drop everything when the bank moves
+    global _generation, _checked_at
+    if not force and time.monotonic() - _checked_at < BANK_REFRESH_SECONDS:
+        return
+    generation = get_bank_generation(db)  # not under the lock: see question_bank.get_bank_index
+    with _lock:
+        if generation != _generation:
+            if _generation is not None:
+                _stats["flushes"] += 1
+            _cache.clear()
+            _generation = generation
+        _checked_at = time.monotonic()
+
+
+def get_question_contents(db: Session, qids: list[int], *, force_check: bool = False) -> dict[int, QuestionContent]:
+    """
+    Question content by id: memory first, then the mapped snapshot, then the
+    database. Ids that do not exist are left out. force_check re-reads the
+    bank generation first instead of trusting a recent check.
+    """
+    _check_generation(db, force_check)
+    found: dict[int, QuestionContent] = {}
+    missing: list[int] = []
+    for qid in qids:
+        q = _cache.get(qid)
+        if q is None:
+            missing.append(qid)
+        else:
+            found[qid] = q
+    if not missing:
+        return found
+
+    snap = current_snapshot(db, force_check=force_check)
+    loaded = snap.lookup(missing) if snap is not None else {}
+    from_snapshot = len(loaded)
+    rest = [qid for qid in missing if qid not in loaded]
+    if rest:
+        loaded.update((q.id, q) for q in load_question_contents(db, rest))
+    with _lock:
+        _stats["from_snapshot"] += from_snapshot
+        _stats["from_db"] += len(loaded) - from_snapshot
+
+    for q in loaded.values():
+        _cache.set(q.id, q)
+    found.update(loaded)
+    return found
+
+
+def content_generation(db: Session) -> int:
+    """
+    Bank generation the cached content belongs to (re-read at most every
+    BANK_REFRESH_SECONDS), for validators of responses built from it.
+    """
+    _check_generation(db)
+    return _generation or 0
+
+
+def get_question_content(db: Session, qid: int) -> QuestionContent | None:
+    return get_question_contents(db, [qid]).get(qid)
+
+
+def invalidate_question_content(qids: list[int] | None = None) -> None:
+    """
+    Forget cached questions after an edit (None: all of them, and re-read the
+    bank generation on the next lookup).
+    """
+    global _checked_at
+    if qids is None:
+        with _lock:
+            _checked_at = 0.0
+        _cache.clear()
+        return
+    for qid in qids:
+        _cache.pop(qid)
+
+
+def question_cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["generation"] = _generation
+    stats.update(_cache.stats())
+    return stats
@@ -0,0 +1,328 @@
+"""
+Read-only binary snapshot of question content (text, explanation, choices,
+correct label), built by build_question_snapshot.py and memory-mapped by
+every worker, so workers on one host share a single page-cache copy and
+serve content without querying questions/choices.
+
+Layout (little-endian):
+
+    header   magic, format, count, bank generation, max question id
+    index    (max_id + 1) x u32 record offset, 0 = no such question
+    records  RECORD, CHOICE x n_choices, then the UTF-8 blobs in order:
+             text, explanation, (label, choice text) x n_choices
+
+A snapshot is only used while its generation equals the bank generation;
+after an import or a new question it is ignored until rebuilt. With
+QUESTION_SHM_NAME set, the same bytes are published in shared memory instead
+(see shared_snapshot.py).
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Choice, Question
+from app.services.question_bank import BANK_REFRESH_SECONDS, get_bank_generation
+
+log = logging.getLogger(__name__)
+
+# empty = no snapshot; content comes from the database
+QUESTION_SNAPSHOT_PATH = os.getenv("QUESTION_SNAPSHOT_PATH", "")
+# shared-memory segment name; takes precedence over QUESTION_SNAPSHOT_PATH
+QUESTION_SHM_NAME = os.getenv("QUESTION_SHM_NAME", "")
+
+MAGIC = b"QBSNAP\x00\x00"
+# bump when the layout changes; older files are rejected instead of misread
+SNAPSHOT_FORMAT = 2
+
+_HEADER = struct.Struct("<8sIIQI")   # magic, format, count, generation, max_id
+_OFFSET = struct.Struct("<I")
+_RECORD = struct.Struct("<IIBB")     # text len, explanation len, choices, correct (1-based, 0 = none)
+_CHOICE = struct.Struct("<IBI")      # choice id, label len, text len
+_NO_EXPLANATION = 0xFFFFFFFF
+
+
+class ChoiceContent(NamedTuple):
+    id: int
+    label: str
+    text: str
+
+
+class QuestionContent(NamedTuple):
+    id: int
+    text: str
+    explanation: str | None
+    choices: tuple[ChoiceContent, ...]  # ordered by label
+    correct_label: str | None
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def encode_snapshot(generation: int, questions: Iterable[QuestionContent]) -> bytes:
+    questions = sorted(questions, key=lambda q: q.id)
+    max_id = questions[-1].id if questions else 0
+
+    records = bytearray()
+    offsets = [0] * (max_id + 1)
+    base = _HEADER.size + _OFFSET.size * (max_id + 1)
+    for q in questions:
+        offsets[q.id] = base + len(records)
+        labels = [c.label for c in q.choices]
+        correct = labels.index(q.correct_label) + 1 if q.correct_label in labels else 0
+        text = q.text.encode("utf-8")
+        explanation = q.explanation.encode("utf-8") if q.explanation is not None else b""
+        choices = [(c.id, c.label.encode("utf-8"), c.text.encode("utf-8")) for c in q.choices]
+
+        records += _RECORD.pack(
+            len(text),
+            len(explanation) if q.explanation is not None else _NO_EXPLANATION,
+            len(choices),
+            correct,
+        )
+        for cid, label, ctext in choices:
+            records += _CHOICE.pack(cid, len(label), len(ctext))
+        records += text + explanation
+        for _cid, label, ctext in choices:
+            records += label + ctext
+
+    if base + len(records) > 0xFFFFFFFF:
+        raise SnapshotError(f"Question bank too large for snapshot format {SNAPSHOT_FORMAT}")
+    header = _HEADER.pack(MAGIC, SNAPSHOT_FORMAT, len(questions), generation, max_id)
+    return header + struct.pack(f"<{max_id + 1}I", *offsets) + bytes(records)
+
+
+class QuestionSnapshot:
+    """
+    Decoder over a snapshot buffer (an mmap, or any bytes-like object).
+    """
+
+    __slots__ = ("buf", "source", "generation", "count", "max_id", "size")
+
+    def __init__(self, buf, source: str = ""):
+        if len(buf) < _HEADER.size:
+            raise SnapshotError(f"{source or 'snapshot'}: truncated header")
+        magic, fmt, count, generation, max_id = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{source or 'snapshot'}: not a question snapshot")
+        if fmt != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"{source or 'snapshot'}: format {fmt}, expected {SNAPSHOT_FORMAT}")
+        if len(buf) < _HEADER.size + _OFFSET.size * (max_id + 1):
+            raise SnapshotError(f"{source or 'snapshot'}: truncated index")
+        self.buf = buf
+        self.source = source
+        self.generation = generation
+        self.count = count
+        self.max_id = max_id
+        self.size = len(buf)
+
+    def get(self, qid: int) -> QuestionContent | None:
+        if qid < 0 or qid > self.max_id:
+            return None
+        buf = self.buf
+        (pos,) = _OFFSET.unpack_from(buf, _HEADER.size + _OFFSET.size * qid)
+        if not pos:
+            return None
+
+        text_len, expl_len, n_choices, correct = _RECORD.unpack_from(buf, pos)
+        pos += _RECORD.size
+        lengths = []
+        for _ in range(n_choices):
+            lengths.append(_CHOICE.unpack_from(buf, pos))
+            pos += _CHOICE.size
+
+        # str(..., "utf-8") decodes bytes (mmap) and memoryviews (shared memory) alike
+        text = str(buf[pos:pos + text_len], "utf-8")
+        pos += text_len
+        explanation = None
+        if expl_len != _NO_EXPLANATION:
+            explanation = str(buf[pos:pos + expl_len], "utf-8")
+            pos += expl_len
+        choices = []
+        for cid, label_len, ctext_len in lengths:
+            label = str(buf[pos:pos + label_len], "utf-8")
+            pos += label_len
+            choices.append(ChoiceContent(cid, label, str(buf[pos:pos + ctext_len], "utf-8")))
+            pos += ctext_len
+
+        return QuestionContent(
+            qid, text, explanation, tuple(choices), choices[correct - 1].label if correct else None
+        )
+
+    def covers(self, qid: int) -> bool:
+        return 0 <= qid <= self.max_id
+
+    def correct_label(self, qid: int) -> str | None:
+        """
+        Just the correct label, without decoding the question text.
+        """
+        if qid < 0 or qid > self.max_id:
+            return None
+        buf = self.buf
+        (pos,) = _OFFSET.unpack_from(buf, _HEADER.size + _OFFSET.size * qid)
+        if not pos:
+            return None
+        text_len, expl_len, n_choices, correct = _RECORD.unpack_from(buf, pos)
+        if not correct:
+            return None
+        pos += _RECORD.size
+        # skip the text blobs and the labels/texts of the choices before it
+        skip = text_len + (0 if expl_len == _NO_EXPLANATION else expl_len)
+        label_len = 0
+        for i in range(correct):
+            _cid, label_len, ctext_len = _CHOICE.unpack_from(buf, pos + _CHOICE.size * i)
+            if i < correct - 1:
+                skip += label_len + ctext_len
+        pos += _CHOICE.size * n_choices + skip
+        return str(buf[pos:pos + label_len], "utf-8")
+
+    def lookup(self, qids: Iterable[int]) -> dict[int, QuestionContent]:
+        out = {}
+        for qid in qids:
+            q = self.get(qid)
+            if q is not None:
+                out[qid] = q
+        return out
+
+
+def load_question_contents(db: Session, qids: list[int] | None = None) -> list[QuestionContent]:
+    """
+    Question content straight from the database (qids=None: whole bank).
+    """
+    q_stmt = select(Question.id, Question.text, Question.explanation).order_by(Question.id)
+    c_stmt = select(Choice.question_id, Choice.id, Choice.label, Choice.text, Choice.is_correct).order_by(
+        Choice.question_id, Choice.label, Choice.id
+    )
+    if qids is not None:
+        q_stmt = q_stmt.where(Question.id.in_(qids))
+        c_stmt = c_stmt.where(Choice.question_id.in_(qids))
+
+    choices: dict[int, list[ChoiceContent]] = {}
+    # several choices may be marked correct: the newest (highest id) wins, the
+    # same rule as the answer key and the SQL scoring
+    correct: dict[int, tuple[int, str]] = {}
+    for qid, cid, label, ctext, is_correct in db.execute(c_stmt):
+        choices.setdefault(qid, []).append(ChoiceContent(cid, label, ctext))
+        if is_correct and cid > correct.get(qid, (0, ""))[0]:
+            correct[qid] = (cid, label)
+    return [
+        QuestionContent(qid, qtext, explanation, tuple(choices.get(qid, ())), correct.get(qid, (0, None))[1])
+        for qid, qtext, explanation in db.execute(q_stmt)
+    ]
+
+
+def build_snapshot(db: Session) -> bytes:
+    """
+    Encode the current bank. Ends the session's transaction.
+    """
+    # one consistent view: the generation must describe exactly the rows read
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    generation = get_bank_generation(db)
+    data = encode_snapshot(generation, load_question_contents(db))
+    db.rollback()
+    return data
+
+
+def write_snapshot(db: Session, path: str) -> QuestionSnapshot:
+    """
+    Build a snapshot of the current bank and atomically replace `path`.
+    Workers that already mapped the old file keep reading it until they reload.
+    """
+    data = build_snapshot(db)
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return QuestionSnapshot(data, path)
+
+
+def open_snapshot(path: str) -> QuestionSnapshot:
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return QuestionSnapshot(mm, path)
+
+
+_lock = threading.Lock()
+_snapshot: QuestionSnapshot | None = None
+_current = False
+_checked_at = 0.0
+_stats = {"loads": 0, "stale": 0, "errors": 0}
+
+
+def _reload(generation: int) -> QuestionSnapshot | None:
+    global _snapshot
+    try:
+        if QUESTION_SHM_NAME:
+            # imported here: shared_snapshot builds on this module
+            from app.services.shared_snapshot import shared_snapshot
+            snap = shared_snapshot(generation)
+        else:
+            snap = open_snapshot(QUESTION_SNAPSHOT_PATH)
+    except Exception:
+        log.exception("question snapshot unavailable; reading questions from the database")
+        _stats["errors"] += 1
+        snap = None
+    if snap is not None and snap is not _snapshot:
+        _stats["loads"] += 1
+    # a single assignment: readers see either the old snapshot or the new one
+    _snapshot = snap
+    return snap
+
+
+def current_snapshot(db: Session, *, force_check: bool = False) -> QuestionSnapshot | None:
+    """
+    The mapped snapshot if it matches the bank generation, else None
+    (caller reads the database). Re-opens the file (or shared segment) when
+    the bank moves, so a rebuilt snapshot is picked up without a restart.
+    """
+    global _current, _checked_at
+    if not (QUESTION_SNAPSHOT_PATH or QUESTION_SHM_NAME):
+        return None
+    if not force_check and time.monotonic() - _checked_at < BANK_REFRESH_SECONDS:
+        return _snapshot if _current else None
+
+    # read before locking: `db` may be an async session driven from the event
+    # loop (see question_bank.get_bank_index); _reload does not use it
+    generation = get_bank_generation(db)
+    with _lock:
+        if not force_check and time.monotonic() - _checked_at < BANK_REFRESH_SECONDS:
+            return _snapshot if _current else None
+        snap = _snapshot
+        if snap is None or snap.generation != generation:
+            snap = _reload(generation)
+        _current = snap is not None and snap.generation == generation
+        if snap is not None and not _current:
+            _stats["stale"] += 1
+        _checked_at = time.monotonic()
+        return snap if _current else None
+
+
+def invalidate_question_snapshot() -> None:
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
+
+
+def question_snapshot_stats() -> dict:
+    snap = _snapshot
+    stats = dict(_stats)
+    stats["source"] = "shm" if QUESTION_SHM_NAME else "file" if QUESTION_SNAPSHOT_PATH else None
+    stats["current"] = _current
+    if snap is not None:
+        stats.update(generation=snap.generation, questions=snap.count, bytes=snap.size)
+    if QUESTION_SHM_NAME:
+        from app.services.shared_snapshot import shared_snapshot_stats
+        stats["shared"] = shared_snapshot_stats()
+    return stats
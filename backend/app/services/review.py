@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import gzip
+import os
+import threading
+from datetime import datetime
+from typing import NamedTuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.cache import LRUCache
+from app.models import ExamAnswer, ExamAttempt, ExamAttemptReview
+from app.schemas import ReviewItemOut
+from app.services.answer_key import correct_labels
+from app.services.exam_flow import attempt_slots
+from app.services.question_content import get_question_contents
+
+# submitted reviews kept in memory, in front of exam_attempt_reviews
+REVIEW_CACHE_SIZE = int(os.getenv("REVIEW_CACHE_SIZE", "500"))
+# compressed reviews larger than this are served from the table only
+REVIEW_CACHE_MAX_BYTES = int(os.getenv("REVIEW_CACHE_MAX_BYTES", str(256 * 1024)))
+
+
+class FrozenReview(NamedTuple):
+    user_id: int
+    submitted_at: datetime
+    payload: bytes  # gzip'd JSON list of ReviewItemOut
+
+
+_reviews = LRUCache(REVIEW_CACHE_SIZE)
+_review_list = TypeAdapter(list[ReviewItemOut])
+_lock = threading.Lock()
+_stats = {"rendered": 0, "loaded": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+
+def build_review_items(db: Session, attempt: ExamAttempt, *, force_check: bool = False) -> list[ReviewItemOut]:
+    # Get attempt questions ordered
+    aqs = attempt_slots(db, attempt)
+    qids = [aq.question_id for aq in aqs]
+
+    # Questions + choices (ordered by label)
+    q_map = get_question_contents(db, qids, force_check=force_check)
+
+    # correct labels
+    correct_map = correct_labels(db, qids, force_check=force_check)
+
+    # answers
+    a_stmt = (
+        select(ExamAnswer.question_id, ExamAnswer.selected_label)
+        .where(ExamAnswer.attempt_id == attempt.id)
+    )
+    ans_map = {qid: sel for (qid, sel) in db.execute(a_stmt).all()}
+
+    out: list[ReviewItemOut] = []
+    for aq in aqs:
+        q = q_map.get(aq.question_id)
+        if not q:
+            continue
+        out.append(
+            ReviewItemOut(
+                position=aq.position,
+                question_id=q.id,
+                text=q.text,
+                topic=aq.topic,
+                subtopic=aq.subtopic,
+                choices=[{"label":c.label, "text":c.text} for c in q.choices],
+                selected_label=ans_map.get(q.id),
+                correct_label=correct_map.get(q.id),
+                explanation=q.explanation,
+            )
+        )
+    return out
+
+
+def cached_review(attempt_id: int) -> FrozenReview | None:
+    return _reviews.get(attempt_id)
+
+
+def frozen_review(db: Session, attempt: ExamAttempt) -> FrozenReview:
+    """
+    Review of a submitted attempt: from memory, else the stored copy, else
+    rendered now and stored. Commits when it stores.
+    """
+    review = _reviews.get(attempt.id)
+    if review is not None:
+        return review
+    attempt_id, user_id, submitted_at = attempt.id, attempt.user_id, attempt.submitted_at  # commit below expires them
+
+    payload = db.execute(
+        select(ExamAttemptReview.payload).where(ExamAttemptReview.attempt_id == attempt.id)
+    ).scalar_one_or_none()
+    if payload is not None:
+        with _lock:
+            _stats["loaded"] += 1
+    else:
+        # stored for good: don't render it from caches that may predate an import
+        raw = _review_list.dump_json(build_review_items(db, attempt, force_check=True))
+        payload = gzip.compress(raw, compresslevel=6)
+        db.execute(
+            pg_insert(ExamAttemptReview)
+            .values(attempt_id=attempt.id, payload=payload, raw_size=len(raw))
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+        with _lock:
+            _stats["rendered"] += 1
+            _stats["raw_bytes"] += len(raw)
+            _stats["stored_bytes"] += len(payload)
+
+    review = FrozenReview(user_id, submitted_at, payload)
+    if len(payload) <= REVIEW_CACHE_MAX_BYTES:
+        _reviews.set(attempt_id, review)
+    return review
+
+
+def review_cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["compression_ratio"] = round(stats["stored_bytes"] / stats["raw_bytes"], 3) if stats["raw_bytes"] else None
+    stats["max_entry_bytes"] = REVIEW_CACHE_MAX_BYTES
+    stats.update(_reviews.stats())
+    return stats
@@ -0,0 +1,193 @@
+"""
+Question snapshot published in POSIX shared memory, so every worker on a host
+reads one copy of question content and correct labels instead of warming its
+own caches.
+
+A tiny control segment (QUESTION_SHM_NAME) holds the generation of the live
+data segment ("<name>-<generation>"). When a worker sees the bank move past
+the published generation, it starts a background build; whichever build takes
+the leader lock first rebuilds the snapshot from the database into a new
+segment, flips the control word and unlinks the previous segment. Requests
+never wait for a build: until it is published they read the database. Other
+workers keep their existing mapping (an unlinked segment stays valid while
+mapped) and attach the new one on their next check; the swap is a single
+reference assignment.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import struct
+import tempfile
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+from app.db import SessionLocal
+from app.services.question_snapshot import (
+    QUESTION_SHM_NAME,
+    QuestionSnapshot,
+    build_snapshot,
+    invalidate_question_snapshot,
+)
+
+log = logging.getLogger(__name__)
+
+_CONTROL = struct.Struct("<8sQ")  # magic, generation of the live data segment (0 = none yet)
+_CONTROL_MAGIC = b"QBSHMCTL"
+
+_lock = threading.Lock()
+_control: shared_memory.SharedMemory | None = None
+_attached: dict[int, tuple[shared_memory.SharedMemory, QuestionSnapshot]] = {}
+_detached: list[shared_memory.SharedMemory] = []  # superseded, still referenced by a reader
+_builder: threading.Thread | None = None
+_stats = {"builds": 0, "attaches": 0, "build_errors": 0}
+
+
+def _open(name: str, *, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # The segments outlive any one worker: keep the resource tracker from
+    # unlinking them when this process exits. The leader unlinks old ones.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(name: str) -> None:
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()  # also drops the tracker registration the constructor made
+
+
+def _segment_name(generation: int) -> str:
+    return f"{QUESTION_SHM_NAME}-{generation}"
+
+
+def _control_segment() -> shared_memory.SharedMemory:
+    global _control
+    if _control is None:
+        try:
+            _control = _open(QUESTION_SHM_NAME, create=True, size=_CONTROL.size)
+            _CONTROL.pack_into(_control.buf, 0, _CONTROL_MAGIC, 0)
+        except FileExistsError:
+            _control = _open(QUESTION_SHM_NAME)
+    return _control
+
+
+def published_generation() -> int:
+    magic, generation = _CONTROL.unpack_from(_control_segment().buf, 0)
+    return generation if magic == _CONTROL_MAGIC else 0
+
+
+def _publish(data: bytes, generation: int) -> None:
+    try:
+        shm = _open(_segment_name(generation), create=True, size=len(data))
+    except FileExistsError:
+        # left over from a leader that died before flipping the control word
+        _unlink(_segment_name(generation))
+        shm = _open(_segment_name(generation), create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    shm.close()
+
+    previous = published_generation()
+    _CONTROL.pack_into(_control_segment().buf, 0, _CONTROL_MAGIC, generation)
+    if previous and previous != generation:
+        _unlink(_segment_name(previous))
+
+
+def _rebuild_as_leader(bank_generation: int) -> bool:
+    """
+    Build and publish the snapshot unless another worker holds the leader
+    lock or it is already published. True if this call published it.
+    """
+    lock_path = os.path.join(tempfile.gettempdir(), f"{QUESTION_SHM_NAME}.lock")
+    with open(lock_path, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False  # another worker is building it; use the database meanwhile
+        try:
+            if published_generation() == bank_generation:
+                return False
+            # own session: building ends its transaction
+            with SessionLocal() as db:
+                data = build_snapshot(db)
+            _publish(data, QuestionSnapshot(data).generation)
+            _stats["builds"] += 1
+            return True
+        except Exception:
+            _stats["build_errors"] += 1
+            raise
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _build_in_background(bank_generation: int) -> None:
+    try:
+        if _rebuild_as_leader(bank_generation):
+            # attach it on the next request instead of after BANK_REFRESH_SECONDS
+            invalidate_question_snapshot()
+    except Exception:
+        log.exception("shared question snapshot build failed; reading questions from the database")
+
+
+def _start_build(bank_generation: int) -> None:
+    # called under _lock; at most one build per process at a time
+    global _builder
+    if _builder is not None and _builder.is_alive():
+        return
+    _builder = threading.Thread(
+        target=_build_in_background, args=(bank_generation,), name="question-shm-build", daemon=True
+    )
+    _builder.start()
+
+
+def _unmap_retired() -> None:
+    # keep the previous mapping for requests still reading it; unmap older ones once unused
+    for old in sorted(_attached)[:-2]:
+        _detached.append(_attached.pop(old)[0])
+    still_used = []
+    for shm in _detached:
+        try:
+            shm.close()
+        except BufferError:
+            still_used.append(shm)
+    _detached[:] = still_used
+
+
+def _attach(generation: int) -> QuestionSnapshot | None:
+    entry = _attached.get(generation)
+    if entry is None:
+        try:
+            shm = _open(_segment_name(generation))
+        except FileNotFoundError:
+            return None  # superseded between reading the control word and attaching
+        entry = _attached[generation] = (shm, QuestionSnapshot(shm.buf.toreadonly(), shm.name))
+        _stats["attaches"] += 1
+        _unmap_retired()
+    return entry[1]
+
+
+def shared_snapshot(bank_generation: int) -> QuestionSnapshot | None:
+    """
+    The published snapshot from shared memory. When it is behind
+    bank_generation, a background build is started and the older generation
+    (the caller checks) or None is returned meanwhile; nothing here touches
+    the database, so it is safe on the request path.
+    """
+    with _lock:
+        generation = published_generation()
+        if generation < bank_generation:
+            _start_build(bank_generation)
+        return _attach(generation) if generation else None
+
+
+def shared_snapshot_stats() -> dict:
+    stats = dict(_stats)
+    stats["name"] = QUESTION_SHM_NAME
+    stats["published_generation"] = published_generation()
+    stats["attached"] = sorted(_attached)
+    stats["building"] = _builder is not None and _builder.is_alive()
+    return stats
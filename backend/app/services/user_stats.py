@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from app.models import ExamAttempt, UserTopicStat
+from app.services.exam_flow import subtopic_scores_from_answers
+
+log = logging.getLogger(__name__)
+
+# weight of the newest attempt in recent_percent (exponential moving average)
+USER_STATS_TREND_ALPHA = float(os.getenv("USER_STATS_TREND_ALPHA", "0.3"))
+
+_UPSERT = """
+    INSERT INTO user_topic_stats AS u
+        (user_id, topic, subtopic, attempts, answered, correct, total, recent_percent, last_percent, last_attempt_at)
+    SELECT :user_id, s.topic, s.subtopic, 1, s.answered, s.correct, s.total,
+           100.0 * s.correct / s.total, round(100.0 * s.correct / s.total), :submitted_at
+    FROM ({source}) s
+    WHERE s.total > 0
+    ON CONFLICT (user_id, topic, subtopic) DO UPDATE SET
+        attempts = u.attempts + 1,
+        answered = u.answered + EXCLUDED.answered,
+        correct = u.correct + EXCLUDED.correct,
+        total = u.total + EXCLUDED.total,
+        recent_percent = CAST(:alpha AS float) * EXCLUDED.recent_percent + (1 - CAST(:alpha AS float)) * u.recent_percent,
+        last_percent = EXCLUDED.last_percent,
+        last_attempt_at = EXCLUDED.last_attempt_at
+"""
+
+# running counters -> rollup in one statement
+_RECORD_FROM_COUNTERS = text(
+    _UPSERT.format(
+        source="""
+        SELECT topic, subtopic, answered, correct, total
+        FROM exam_attempt_topic_scores
+        WHERE attempt_id = :attempt_id
+        """
+    )
+)
+
+_RECORD_FROM_ROWS = text(
+    _UPSERT.format(
+        source="""
+        SELECT *
+        FROM unnest(
+            CAST(:topics AS varchar[]),
+            CAST(:subtopics AS varchar[]),
+            CAST(:answered AS integer[]),
+            CAST(:correct AS integer[]),
+            CAST(:total AS integer[])
+        ) AS t(topic, subtopic, answered, correct, total)
+        """
+    )
+)
+
+
+def record_submission(db: Session, attempt: ExamAttempt) -> None:
+    """
+    Fold a just-submitted attempt into its user's rollup. Runs in the caller's
+    transaction, so the rollup commits (or not) together with the submit.
+    """
+    params = {
+        "user_id": attempt.user_id,
+        "submitted_at": attempt.submitted_at,
+        "alpha": USER_STATS_TREND_ALPHA,
+    }
+    if attempt.correct_count is not None:
+        db.execute(_RECORD_FROM_COUNTERS, {**params, "attempt_id": attempt.id})
+        return
+
+    rows = subtopic_scores_from_answers(db, attempt)
+    if not rows:
+        return
+    db.execute(
+        _RECORD_FROM_ROWS,
+        {
+            **params,
+            "topics": [r.topic for r in rows],
+            "subtopics": [r.subtopic for r in rows],
+            "answered": [r.answered for r in rows],
+            "correct": [r.correct for r in rows],
+            "total": [r.total for r in rows],
+        },
+    )
+
+
+def record_counted_submissions(db: Session, attempts: list[tuple[int, int, datetime]]) -> None:
+    """
+    record_submission for many counter-tracked attempts at once, given as
+    (attempt_id, user_id, submitted_at). Applied in order, in one round trip.
+    """
+    if not attempts:
+        return
+    db.execute(
+        _RECORD_FROM_COUNTERS,
+        [
+            {"attempt_id": attempt_id, "user_id": user_id, "submitted_at": submitted_at, "alpha": USER_STATS_TREND_ALPHA}
+            for attempt_id, user_id, submitted_at in attempts
+        ],
+    )
+
+
+def user_topic_stats(db: Session, user_id: int) -> list[UserTopicStat]:
+    stmt = (
+        select(UserTopicStat)
+        .where(UserTopicStat.user_id == user_id)
+        .order_by(UserTopicStat.topic, UserTopicStat.subtopic)
+    )
+    return list(db.scalars(stmt).all())
+
+
+def rebuild_user_stats(db: Session, user_id: int | None = None) -> int:
+    """
+    Recompute the rollup from submitted attempts, oldest first so the trend
+    replays in order. One transaction, so readers never see a half-built rollup.
+    An attempt that cannot be replayed (its questions are gone) is logged and
+    left out. Returns the number of attempts folded in.
+    """
+    wipe = delete(UserTopicStat)
+    attempts = select(ExamAttempt).where(ExamAttempt.submitted_at.is_not(None))
+    if user_id is not None:
+        wipe = wipe.where(UserTopicStat.user_id == user_id)
+        attempts = attempts.where(ExamAttempt.user_id == user_id)
+    db.execute(wipe)
+
+    count = 0
+    for attempt in db.scalars(attempts.order_by(ExamAttempt.submitted_at, ExamAttempt.id)).all():
+        attempt_id = attempt.id
+        try:
+            # savepoint: one bad attempt is skipped instead of aborting the rebuild
+            with db.begin_nested():
+                record_submission(db, attempt)
+        except Exception:
+            log.exception("could not replay attempt %s into topic stats; skipped", attempt_id)
+            continue
+        count += 1
+    db.commit()
+    return count
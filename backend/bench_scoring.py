@@ -0,0 +1,107 @@
+"""
+Compare ways of scoring attempts against the live database:
+
+  python-loop   slots, correct labels and answers pulled into dicts, counted in Python
+  sql-aggregate one GROUP BY over exam_attempt_questions/exam_answers/choices
+  submit-old    read the counters, then UPDATE the attempt (two round trips)
+  submit-sql    score and UPDATE in one statement (what /attempts/submit runs)
+
+Nothing is changed: every submit is rolled back.
+"""
+import argparse
+import time
+
+from sqlalchemy import select
+
+from app.db import SessionLocal
+from app.models import ExamAnswer, ExamAttempt, ExamAttemptQuestion
+from app.services.answer_key import correct_labels
+from app.services.exam_flow import (
+    PASSING_PERCENT,
+    _score_key,
+    attempt_slots,
+    finalize_attempt,
+    score_attempt,
+    subtopic_scores_from_answers,
+)
+
+
+def python_loop(db, attempt):
+    # the scoring loop /attempts/submit used before the SQL aggregate
+    slots = attempt_slots(db, attempt)
+    correct_map = correct_labels(db, [s.question_id for s in slots])
+    ans_map = dict(
+        db.execute(
+            select(ExamAnswer.question_id, ExamAnswer.selected_label).where(ExamAnswer.attempt_id == attempt.id)
+        ).all()
+    )
+    counts = {}
+    for s in slots:
+        c = counts.setdefault(_score_key(s.topic, s.subtopic), [0, 0, 0])
+        c[2] += 1
+        if s.question_id in ans_map:
+            c[0] += 1
+        if ans_map.get(s.question_id) is not None and ans_map.get(s.question_id) == correct_map.get(s.question_id):
+            c[1] += 1
+    return sorted((t, sub, *c) for (t, sub), c in counts.items())
+
+
+def sql_aggregate(db, attempt):
+    return sorted(tuple(r) for r in subtopic_scores_from_answers(db, attempt))
+
+
+def submit_old(db, attempt):
+    score = score_attempt(db, attempt)
+    attempt.score_percent = int(round((score.correct / score.total) * 100)) if score.total else 0
+    attempt.passed = attempt.score_percent >= PASSING_PERCENT
+    attempt.submitted_at = attempt.started_at
+    db.flush()
+    db.rollback()
+
+
+def submit_sql(db, attempt):
+    finalize_attempt(db, attempt, attempt.started_at)
+    db.rollback()
+
+
+def bench(name, fn, db, attempts, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for attempt_id in attempts:
+            fn(db, db.get(ExamAttempt, attempt_id))
+    elapsed = time.perf_counter() - started
+    calls = repeat * len(attempts)
+    print(f"{name:14} {calls:6} calls  {elapsed / calls * 1000:8.3f} ms/attempt")
+
+
+def main(limit: int, repeat: int):
+    with SessionLocal() as db:
+        # biggest stored attempts first: that is where the loop hurts
+        attempts = db.scalars(
+            select(ExamAttempt.id)
+            .where(ExamAttempt.id.in_(select(ExamAttemptQuestion.attempt_id)))
+            .order_by(ExamAttempt.question_count.desc(), ExamAttempt.id.desc())
+            .limit(limit)
+        ).all()
+        if not attempts:
+            raise SystemExit("No attempts with stored questions to score.")
+        sizes = [db.get(ExamAttempt, a).question_count for a in attempts]
+        print(f"{len(attempts)} attempts, {min(sizes)}-{max(sizes)} questions each, x{repeat}")
+
+        for attempt_id in attempts:
+            attempt = db.get(ExamAttempt, attempt_id)
+            assert python_loop(db, attempt) == sql_aggregate(db, attempt), f"scores differ for attempt {attempt_id}"
+
+        bench("python-loop", python_loop, db, attempts, repeat)
+        bench("sql-aggregate", sql_aggregate, db, attempts, repeat)
+        counted = [a for a in attempts if db.get(ExamAttempt, a).correct_count is not None]
+        bench("submit-old", submit_old, db, counted, repeat)
+        bench("submit-sql", submit_sql, db, counted, repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark attempt scoring.")
+    parser.add_argument("--limit", type=int, default=50, help="attempts to score")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.limit, args.repeat)
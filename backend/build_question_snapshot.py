@@ -0,0 +1,19 @@
+import sys
+
+from app.db import SessionLocal
+from app.services.question_snapshot import QUESTION_SNAPSHOT_PATH, write_snapshot
+
+
+def main(args):
+    path = args[0] if args else QUESTION_SNAPSHOT_PATH
+    if not path:
+        raise SystemExit("Usage: python build_question_snapshot.py [path]  (or set QUESTION_SNAPSHOT_PATH)")
+    with SessionLocal() as db:
+        snap = write_snapshot(db, path)
+    print(f"Wrote {snap.count} questions ({snap.size} bytes, generation {snap.generation}) to {path}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        raise SystemExit("Usage: python build_question_snapshot.py [path]")
+    main(sys.argv[1:])
@@ -0,0 +1,18 @@
+import sys
+
+from app.db import SessionLocal
+from app.services.user_stats import rebuild_user_stats
+
+
+def main(args):
+    user_id = int(args[0]) if args else None
+    with SessionLocal() as db:
+        count = rebuild_user_stats(db, user_id)
+    scope = f"user {user_id}" if user_id is not None else "all users"
+    print(f"Rebuilt topic stats for {scope} from {count} submitted attempts.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        raise SystemExit("Usage: python rebuild_user_stats.py [user_id]")
+    main(sys.argv[1:])
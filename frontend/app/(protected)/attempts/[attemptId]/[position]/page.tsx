@@ -2,7 +2,12 @@
 
 import { useEffect, useMemo, useRef, useState } from "react";
 import { useParams, useRouter } from "next/navigation";
-import { api, QuestionForAttemptOut } from "@/src/lib/api";
+import {
+  api,
+  loadQuestion,
+  rememberAnswer,
+  QuestionForAttemptOut,
+} from "@/src/lib/api";
 
 type AttemptMeta = {
   mode: "practice" | "timed";
@@ -58,8 +63,7 @@ export default function QuestionPage() {
     setError(null);
     setData(null);
 
-    api
-      .getQuestion(attemptId, position)
+    loadQuestion(attemptId, position)
       .then((q) => {
         if (!mounted) return;
         setData(q);
@@ -144,6 +148,7 @@ export default function QuestionPage() {
         question_id: data.question_id,
         selected_label: label,
       });
+      rememberAnswer(attemptId, position, label);
       markAnswered(position);
     } catch (e: any) {
       setError(e.message ?? "Failed to save answer");
@@ -31,9 +31,9 @@ export default function HomePage() {
         setUser(me);
 
         setAttemptsLoading(true);
-        const list = await api.myAttempts();
+        const page = await api.myAttempts();
         if (cancelled) return;
-        setAttempts(list);
+        setAttempts(page.items);
       } catch (e: any) {
         // not logged in (401) is normal
         if (!cancelled) {
@@ -10,7 +10,8 @@ async function apiFetch<T>(path: string, init?: RequestInit): Promise<T> {
       credentials: "include",
     },
     credentials: "include",
-    cache: "no-store",
+    // callers opt in to the HTTP cache for resources the API sends validators for
+    cache: init?.cache ?? "no-store",
   });
 
   if (!res.ok) {
@@ -122,6 +123,19 @@ export type AttemptSummary = {
   passed: boolean | null;
 };
 
+export type AttemptPage = {
+  items: AttemptSummary[];
+  next_cursor: number | null;
+};
+
+export type AttemptFilters = {
+  cursor?: number;
+  limit?: number;
+  mode?: AttemptMode;
+  exam_name?: string;
+  submitted?: boolean;
+};
+
 
 export const api = {
   // --- auth ---
@@ -145,7 +159,14 @@ export const api = {
 
   me: () => apiFetch<UserOut>("/auth/me"),
 
-  myAttempts: () => apiFetch<AttemptSummary[]>("/me/attempts"),
+  myAttempts: (filters: AttemptFilters = {}) => {
+    const qs = new URLSearchParams();
+    for (const [k, v] of Object.entries(filters)) {
+      if (v !== undefined) qs.set(k, String(v));
+    }
+    const q = qs.toString();
+    return apiFetch<AttemptPage>(`/me/attempts${q ? `?${q}` : ""}`);
+  },
 
   startAttempt: (payload: AttemptStartIn) =>
     apiFetch<AttemptStartOut>("/attempts/start", {
@@ -155,7 +176,13 @@ export const api = {
 
   getQuestion: (attemptId: number, position: number) =>
     apiFetch<QuestionForAttemptOut>(
-      `/attempts/${attemptId}/questions/${position}`
+      `/attempts/${attemptId}/questions/${position}`,
+      { cache: "default" } // ETag-revalidated; reused as-is once submitted
+    ),
+
+  getQuestionWindow: (attemptId: number, from: number, to: number) =>
+    apiFetch<QuestionForAttemptOut[]>(
+      `/attempts/${attemptId}/questions?from=${from}&to=${to}`
     ),
 
   answer: (attemptId: number, payload: AnswerIn) =>
@@ -164,9 +191,107 @@ export const api = {
       body: JSON.stringify(payload),
     }),
 
+  answers: (attemptId: number, payload: AnswerIn[]) =>
+    apiFetch<{ ok: boolean; saved: number }>(`/attempts/${attemptId}/answers`, {
+      method: "POST",
+      body: JSON.stringify(payload),
+    }),
+
+  // cached questions predate submit (no explanations): drop them either way
   submit: (attemptId: number) =>
-    apiFetch<SubmitOut>(`/attempts/${attemptId}/submit`, { method: "POST" }),
+    apiFetch<SubmitOut>(`/attempts/${attemptId}/submit`, {
+      method: "POST",
+    }).finally(() => forgetAttemptQuestions(attemptId)),
 
   review: (attemptId: number) =>
-    apiFetch<ReviewItemOut[]>(`/attempts/${attemptId}/review`),
+    apiFetch<ReviewItemOut[]>(`/attempts/${attemptId}/review`, {
+      cache: "default",
+    }),
 };
+
+// --- question prefetch ---
+// Questions are fetched in windows and kept per attempt, so Next/Prev
+// navigation is usually served without a round trip. The cache holds open
+// attempts only (submit drops an attempt's entries) and at most
+// MAX_CACHED_QUESTIONS, least recently used out first.
+const QUESTION_WINDOW = 10;
+const MAX_CACHED_QUESTIONS = 300;
+const questionCache = new Map<string, QuestionForAttemptOut>();
+const inflightWindows = new Map<string, Promise<void>>();
+
+const questionKey = (attemptId: number, position: number) =>
+  `${attemptId}:${position}`;
+
+function cacheQuestion(key: string, q: QuestionForAttemptOut) {
+  // Map keeps insertion order: re-insert to mark as recently used
+  questionCache.delete(key);
+  questionCache.set(key, q);
+  while (questionCache.size > MAX_CACHED_QUESTIONS) {
+    const oldest = questionCache.keys().next().value;
+    if (oldest === undefined) break;
+    questionCache.delete(oldest);
+  }
+}
+
+export function forgetAttemptQuestions(attemptId: number) {
+  const prefix = `${attemptId}:`;
+  for (const map of [questionCache, inflightWindows]) {
+    for (const key of [...map.keys()]) {
+      if (key.startsWith(prefix)) map.delete(key);
+    }
+  }
+}
+
+function fetchWindow(attemptId: number, from: number): Promise<void> {
+  const key = questionKey(attemptId, from);
+  const pending = inflightWindows.get(key);
+  if (pending) return pending;
+
+  const p = api
+    .getQuestionWindow(attemptId, from, from + QUESTION_WINDOW - 1)
+    .then((items) => {
+      // dropped meanwhile (attempt submitted): don't bring stale copies back
+      if (inflightWindows.get(key) !== p) return;
+      for (const q of items) {
+        cacheQuestion(questionKey(attemptId, q.position), q);
+      }
+    })
+    .finally(() => {
+      // a newer fetch may own the key by now; leave its entry alone
+      if (inflightWindows.get(key) === p) inflightWindows.delete(key);
+    });
+  inflightWindows.set(key, p);
+  return p;
+}
+
+export async function loadQuestion(
+  attemptId: number,
+  position: number
+): Promise<QuestionForAttemptOut> {
+  const key = questionKey(attemptId, position);
+  let q = questionCache.get(key);
+  if (q) {
+    cacheQuestion(key, q);
+  } else {
+    await fetchWindow(attemptId, position);
+    q = questionCache.get(key);
+  }
+  if (!q) return api.getQuestion(attemptId, position);
+
+  // warm the next window before the user reaches the end of this one
+  const ahead = position + Math.floor(QUESTION_WINDOW / 2);
+  if (!questionCache.has(questionKey(attemptId, ahead))) {
+    fetchWindow(attemptId, ahead).catch(() => {});
+  }
+  return q;
+}
+
+export function rememberAnswer(
+  attemptId: number,
+  position: number,
+  label: string
+) {
+  const key = questionKey(attemptId, position);
+  const q = questionCache.get(key);
+  if (q) cacheQuestion(key, { ...q, selected_label: label });
+}